@@ -1,5 +1,9 @@
 from XRPLib.defaults import *
+from XRPLib.autotuner import RelayAutotuner
+from XRPLib.cascade_controller import CascadeController
+from XRPLib.pid import PID
 import time
+import math
 
 """
     By the end of this file students will learn how to control the drivetrain,
@@ -43,6 +47,13 @@ def square(sidelength):
     # Alternatively:
     # polygon(sidelength, 4)
 
+# Follow the perimeter of a square with rounded corners, without stopping to turn in place
+# Side length and corner radius in centimeters
+def rounded_square(sidelength, corner_radius = 10):
+    for sides in range(4):
+        drivetrain.straight(sidelength - 2*corner_radius, 0.8)
+        drivetrain.arc(corner_radius, 90, 20)
+
 # Follow the perimeter of an arbitrary polygon with variable side length and number of sides
 # Side length in centimeters
 def polygon(side_length, number_of_sides):
@@ -69,4 +80,26 @@ def test_drive():
 
     print("drive backwards 25 cm by setting distance negative")
     # There is no difference between setting speed or distance negative, both work
-    drivetrain.straight(-25,0.8)
\ No newline at end of file
+    drivetrain.straight(-25,0.8)
+
+# Find PID gains for turning by making the robot rock back and forth around a heading,
+# then use the tuned controller for a turn
+def autotune_turn():
+    tuner = RelayAutotuner(relay_amplitude=0.4, hysteresis=1)
+    drivetrain.turn(0, main_controller=tuner, timeout=15)
+    print(f"Ultimate gain: {tuner.get_ultimate_gain()}, ultimate period: {tuner.get_ultimate_period()}")
+    tuned = tuner.get_pid(RelayAutotuner.NO_OVERSHOOT, min_output=0.1, max_output=0.5, tolerance=1, tolerance_count=3)
+    if tuned is not None:
+        drivetrain.turn(90, main_controller=tuned)
+
+
+# Drive forward with a cascaded controller: an outer distance loop sets a target speed,
+# which an inner loop tracks using the measured wheel speed
+def cascade_straight(distance: float = 50):
+    rpm_to_cmps = math.pi * drivetrain.wheel_diam / 60
+    # Distance error (cm) in, target speed (cm/s) out
+    outer = PID(kp=2, max_output=30, tolerance=0.25, tolerance_count=3)
+    # Speed error (cm/s) in, effort out
+    inner = PID(kp=0.02, ki=0.05, max_output=0.8)
+    controller = CascadeController(outer, inner, lambda: (left_motor.get_speed() + right_motor.get_speed()) / 2 * rpm_to_cmps)
+    drivetrain.straight(distance, main_controller=controller)
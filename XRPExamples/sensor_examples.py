@@ -1,4 +1,6 @@
 from XRPLib.defaults import *
+from XRPLib.rate_limiter import RateLimiter
+from XRPLib.line_estimator import LineEstimator
 import time
 
 """
@@ -16,42 +18,72 @@ def ultrasonic_test():
 # Approaches a wall at a set speed and then stops
 def drive_till_close(target_distance: float = 10.0):
     speed = 0.6
+    # Only nearby objects matter here, so gate the range to ping faster
+    rangefinder.set_max_range(target_distance * 3)
+    # Ping in the background so the loop never waits on the sensor
+    rangefinder.start_ranging()
+    rate = RateLimiter(100)
     while rangefinder.distance() > target_distance:
         drivetrain.set_effort(speed, speed)
-        time.sleep(0.01)
+        rate.sleep()
     drivetrain.set_effort(0, 0)
+    rangefinder.set_max_range(None)
 
 # Maintains a certain distance from the wall using proportional control
 def standoff(target_distance: float = 10.0):
     KP = 0.2
+    # Ping in the background so the loop never waits on the sensor
+    rangefinder.start_ranging()
+    rate = RateLimiter(100)
     while True:
         distance = rangefinder.distance()
         error = distance - target_distance
         drivetrain.set_effort(error * KP, error*KP)
-        time.sleep(0.01)
+        rate.sleep()
 
 # Maintains a certain distance from the wall while driving
 #     using proportional control (sensor on right side of robot this time)
 def wall_follow(target_distance: float = 10.0):
     KP = 0.1
     base_speed = 0.5
+    # Ping in the background so the loop never waits on the sensor
+    rangefinder.start_ranging()
+    rate = RateLimiter(100)
     while True:
-        distance = rangefinder.distance()
+        # Filtered so that a single bad echo doesn't jerk the robot around
+        distance = rangefinder.get_filtered_distance()
         error = distance - target_distance
         print(error)
         drivetrain.set_effort(base_speed + error * KP, base_speed - error*KP)
-        time.sleep(0.01)
+        rate.sleep()
 
 # Follows a line using the line followers
 def line_track():
     base_effort = 0.6
     KP = 0.6
+    # Start with the robot over the line; it sweeps across it to learn what the line and background look like
+    reflectance.calibrate(drivetrain)
+    rate = RateLimiter(100)
     while True:
-        # You always want to take the difference of the sensors because the raw value isn't always consistent.
+        # Calibrated, both sensors read 0 on the background and 1 on the line, so the difference is a fair error.
         error = reflectance.get_left() - reflectance.get_right()
         print(error)
         drivetrain.set_effort(base_effort - error * KP, base_effort + error * KP)
-        time.sleep(0.01)
+        rate.sleep()
+
+# Follows a line using the line position estimate, stopping at the end of the line
+def line_follow():
+    base_effort = 0.6
+    KP = 0.6
+    reflectance.calibrate(drivetrain)
+    line = LineEstimator.get_default_line_estimator()
+    rate = RateLimiter(100)
+    while not line.is_line_end():
+        # The position keeps pointing at the side the line was last seen on, so the robot turns back if it overshoots
+        error = line.get_position()
+        drivetrain.set_effort(base_effort - error * KP, base_effort + error * KP)
+        rate.sleep()
+    drivetrain.stop()
 
 # Polling data from the IMU
 def imu_test():
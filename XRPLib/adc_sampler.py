@@ -0,0 +1,145 @@
+from machine import Pin, ADC, Timer
+from array import array
+
+class ADCSampler:
+
+    _DEFAULT_ADC_SAMPLER_INSTANCE = None
+
+    @classmethod
+    def get_default_adc_sampler(cls):
+        """
+        Get the default XRP ADC sampler instance, which samples both reflectance sensors and the battery voltage.
+        This is a singleton, so only one instance of the default ADC sampler will ever exist.
+        """
+        if cls._DEFAULT_ADC_SAMPLER_INSTANCE is None:
+            cls._DEFAULT_ADC_SAMPLER_INSTANCE = cls(["LINE_L", "LINE_R", "BOARD_VIN_MEASURE"])
+        return cls._DEFAULT_ADC_SAMPLER_INSTANCE
+
+    def __init__(self, pins: list, sample_freq: int = 600, oversample: int = 4, window: int = 4):
+        """
+        Samples several analog pins in the background, taking turns between them at a fixed rate.
+        Each sample is the sum of a few back to back ADC reads, and the last few samples of each pin are kept
+        in a ring buffer with a running total, so reading a pin returns a smoothed value straight away
+        without waiting on the ADC.
+
+        Use get_channel() to get an object that can be read like an ADC, but returns the smoothed value.
+
+        :param pins: The analog pins to sample
+        :type pins: list<int|str>
+        :param sample_freq: How many samples to take per second, across all pins. Each pin is sampled sample_freq / len(pins) times per second
+        :type sample_freq: int
+        :param oversample: The number of ADC reads summed into each sample
+        :type oversample: int
+        :param window: The number of samples of each pin to average over
+        :type window: int
+        """
+        self.pins = pins
+        self.oversample = oversample
+        self.window = window
+        self._adcs = [ADC(Pin(pin)) for pin in pins]
+        self._divisor = oversample * window
+
+        # All the ring buffers live in one flat array, window entries per pin
+        self._samples = array('i', [0] * (len(pins) * window))
+        self._sums = array('i', [0] * len(pins))
+        self._indices = array('i', [0] * len(pins))
+        self._next_channel = 0
+        self._round_callbacks = []
+
+        # Fill every buffer with a real reading, so values are sensible before the first full window
+        for channel in range(len(pins)):
+            for _ in range(window):
+                self._sample(channel)
+
+        self._timer = Timer(-1)
+        self._timer.init(freq=sample_freq, callback=lambda t:self._update())
+
+    def get_channel(self, pin):
+        """
+        :param pin: One of the pins this sampler was created with
+        :type pin: int|str
+        :return: An object with the same read_u16() method as an ADC, returning the smoothed value of the pin
+        :rtype: SampledADC
+        """
+        if pin not in self.pins:
+            raise ValueError("Pin " + str(pin) + " is not sampled by this ADCSampler")
+        return SampledADC(self, self.pins.index(pin))
+
+    def read_u16(self, channel: int) -> int:
+        """
+        :param channel: The index of the pin in the list the sampler was created with
+        :type channel: int
+        :return: The smoothed reading of the pin, ranging from 0 to 65535
+        :rtype: int
+        """
+        return self._sums[channel] // self._divisor
+
+    def add_round_callback(self, callback):
+        """
+        Calls a function each time every pin has been sampled once more, so that anything built on the readings
+        can be updated in step with them. The function is called from the sampler's timer, so it should be short
+
+        :param callback: A function that takes no arguments
+        :type callback: function
+        """
+        self._round_callbacks.append(callback)
+
+    def stop(self):
+        """
+        Stops sampling. Readings stay at their last values
+        """
+        self._timer.deinit()
+
+    def _sample(self, channel: int):
+        """
+        Non-api method; takes one oversampled reading of a channel and adds it to the channel's ring buffer
+        """
+        adc = self._adcs[channel]
+        total = 0
+        for _ in range(self.oversample):
+            total += adc.read_u16()
+
+        index = self._indices[channel]
+        slot = channel * self.window + index
+        # Keep the running total up to date instead of summing the whole buffer on every read
+        self._sums[channel] += total - self._samples[slot]
+        self._samples[slot] = total
+        index += 1
+        if index >= self.window:
+            index = 0
+        self._indices[channel] = index
+
+    def _update(self):
+        """
+        Non-api method; samples the next channel in turn. Called by the timer
+        """
+        channel = self._next_channel
+        self._sample(channel)
+        channel += 1
+        if channel >= len(self._adcs):
+            channel = 0
+        self._next_channel = channel
+        if channel == 0:
+            for callback in self._round_callbacks:
+                callback()
+
+
+class SampledADC:
+    def __init__(self, sampler: ADCSampler, channel: int):
+        """
+        One pin of an ADCSampler, which can be used anywhere an ADC is read with read_u16()
+
+        :param sampler: The sampler the pin belongs to
+        :type sampler: ADCSampler
+        :param channel: The index of the pin in the sampler
+        :type channel: int
+        """
+        self.sampler = sampler
+        self.channel = channel
+
+    def read_u16(self) -> int:
+        """
+        :return: The smoothed reading of the pin, ranging from 0 to 65535
+        :rtype: int
+        """
+        return self.sampler.read_u16(self.channel)
@@ -0,0 +1,150 @@
+import time
+import math
+from .controller import Controller
+from .pid import PID
+
+"""
+Relay feedback PID autotuner (Astrom-Hagglund)
+"""
+
+class RelayAutotuner(Controller):
+
+    # Tuning rules, as (kp / ku, ti / tu, td / tu). A ti of 0 means no integral term
+    ZIEGLER_NICHOLS = (0.6, 0.5, 0.125)
+    TYREUS_LUYBEN = (0.45, 2.2, 0.159)
+    NO_OVERSHOOT = (0.2, 0.5, 0.333)
+    PI_ONLY = (0.45, 0.833, 0)
+
+    def __init__(self,
+                 relay_amplitude = 0.3,
+                 output_bias = 0.0,
+                 hysteresis = 0.0,
+                 cycles = 4,
+                 settle_cycles = 1
+                 ):
+        """
+        Finds PID gains for a system by replacing the controller with a relay, which makes the system oscillate
+        around its setpoint. The amplitude and period of that oscillation give the ultimate gain and period of the
+        system, from which PID gains can be worked out.
+
+        Use it anywhere a Controller is accepted. For example, give it to EncodedMotor.set_speed_controller() and
+        set a speed, or pass it as the main_controller of DifferentialDrive.turn(). Once is_done() returns True,
+        get_pid() returns a tuned PID controller.
+
+        :param relay_amplitude: How far the output switches either side of the bias. Should be large enough to make the system move clearly
+        :param output_bias: The output the relay switches around. For speed control, this should be roughly the effort that holds the target speed
+        :param hysteresis: How far the error must cross zero before the relay switches, to stop noise from switching it
+        :param cycles: The number of full oscillations to measure
+        :param settle_cycles: The number of full oscillations to ignore at the start, while the oscillation builds up
+        """
+        self.relay_amplitude = relay_amplitude
+        self.output_bias = output_bias
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.settle_cycles = settle_cycles
+
+        self.clear_history()
+
+    def update(self, error: float) -> float:
+        """
+        Handle a new update of the relay experiment given an error.
+
+        :param error: The error of the system being tuned
+        :type error: float
+
+        :return: The relay output, either output_bias + relay_amplitude or output_bias - relay_amplitude
+        :rtype: float
+        """
+        current_time = time.ticks_ms()
+
+        if self.relay_high is None:
+            # First update; start by pushing the error towards zero
+            self.relay_high = error > 0
+
+        # Track the extremes of the error over the current cycle
+        if error > self.cycle_max:
+            self.cycle_max = error
+        if error < self.cycle_min:
+            self.cycle_min = error
+
+        if self.relay_high and error < -self.hysteresis:
+            self.relay_high = False
+        elif not self.relay_high and error > self.hysteresis:
+            # Each switch back to high marks the end of a full cycle
+            self.relay_high = True
+            if self.prev_switch_time is not None:
+                self.cycle_count += 1
+                if self.cycle_count > self.settle_cycles and self.cycle_count <= self.settle_cycles + self.cycles:
+                    self.period_sum += time.ticks_diff(current_time, self.prev_switch_time) / 1000
+                    self.amplitude_sum += (self.cycle_max - self.cycle_min) / 2
+            self.prev_switch_time = current_time
+            self.cycle_max = error
+            self.cycle_min = error
+
+        if self.relay_high:
+            return self.output_bias + self.relay_amplitude
+        return self.output_bias - self.relay_amplitude
+
+    def is_done(self) -> bool:
+        """
+        :return: If enough oscillations have been measured to compute the tuning
+        :rtype: bool
+        """
+        return self.cycle_count >= self.settle_cycles + self.cycles
+
+    def clear_history(self):
+        """
+        Restarts the experiment, discarding any measured oscillations
+        """
+        self.relay_high = None
+        self.prev_switch_time = None
+        self.cycle_count = 0
+        self.cycle_max = -math.inf
+        self.cycle_min = math.inf
+        self.period_sum = 0
+        self.amplitude_sum = 0
+
+    def get_ultimate_gain(self) -> float:
+        """
+        :return: The ultimate gain of the system; the proportional gain at which it would oscillate steadily. None if the experiment hasn't finished
+        :rtype: float
+        """
+        if not self.is_done() or self.amplitude_sum == 0:
+            return None
+        amplitude = self.amplitude_sum / self.cycles
+        return 4 * self.relay_amplitude / (math.pi * amplitude)
+
+    def get_ultimate_period(self) -> float:
+        """
+        :return: The period of the oscillation, in seconds. None if the experiment hasn't finished
+        :rtype: float
+        """
+        if not self.is_done():
+            return None
+        return self.period_sum / self.cycles
+
+    def get_pid(self, rule: tuple = None, **kwargs) -> PID:
+        """
+        Builds a PID controller from the measured ultimate gain and period
+
+        :param rule: The tuning rule to use, such as RelayAutotuner.ZIEGLER_NICHOLS (the default), RelayAutotuner.TYREUS_LUYBEN,
+            RelayAutotuner.NO_OVERSHOOT, or RelayAutotuner.PI_ONLY
+        :type rule: tuple
+        :param kwargs: Any other parameters for the PID, such as max_output or tolerance
+        :return: The tuned PID controller. None if the experiment hasn't finished
+        :rtype: PID
+        """
+        ku = self.get_ultimate_gain()
+        tu = self.get_ultimate_period()
+        if ku is None or tu is None:
+            return None
+
+        if rule is None:
+            rule = self.ZIEGLER_NICHOLS
+        kp_ratio, ti_ratio, td_ratio = rule
+
+        kp = kp_ratio * ku
+        ki = kp / (ti_ratio * tu) if ti_ratio > 0 else 0
+        kd = kp * td_ratio * tu
+
+        return PID(kp = kp, ki = ki, kd = kd, **kwargs)
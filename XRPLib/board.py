@@ -2,6 +2,7 @@ from machine import Pin, ADC, Timer
 from neopixel import NeoPixel
 import time
 import sys
+from .adc_sampler import ADCSampler
 
 class Board:
 
@@ -13,11 +14,11 @@ class Board:
         Get the default board instance. This is a singleton, so only one instance of the board will ever exist.
         """
         if cls._DEFAULT_BOARD_INSTANCE is None:
-            cls._DEFAULT_BOARD_INSTANCE = cls()
+            cls._DEFAULT_BOARD_INSTANCE = cls(sampler=ADCSampler.get_default_adc_sampler())
         return cls._DEFAULT_BOARD_INSTANCE
 
     def __init__(self, vin_pin="BOARD_VIN_MEASURE", button_pin="BOARD_USER_BUTTON", 
-                 rgb_led_pin = "BOARD_NEOPIXEL", led_pin = "LED"):
+                 rgb_led_pin = "BOARD_NEOPIXEL", led_pin = "LED", sampler: ADCSampler = None):
         """
         Implements for extra features on the XRP board. Handles the on/off switch, button, and LED.
 
@@ -25,9 +26,23 @@ class Board:
         :type vin_pin: int
         :param button_pin: The pin the button is connected to
         :type button_pin: int
+        :param sampler: An optional ADCSampler that samples the vin pin in the background, so checking the switch never waits on the ADC
+        :type sampler: ADCSampler
         """
 
-        self.on_switch = ADC(Pin(vin_pin))
+        self.sampler = sampler
+        if sampler is None:
+            self.on_switch = ADC(Pin(vin_pin))
+        else:
+            self.on_switch = sampler.get_channel(vin_pin)
+
+        # VIN reaches the ADC through a voltage divider; this converts ADC counts back to volts at VIN
+        self.vin_scale = 3.3 * 3.0 / 65535
+        # Low pass filter constant for the battery voltage, so motor current spikes don't show up in it
+        self.vin_filter = 0.02
+        self._vin_filtered = self.on_switch.read_u16() * self.vin_scale
+        if sampler is not None:
+            sampler.add_round_callback(self._update_vin)
         
         self.button = Pin(button_pin, Pin.IN, Pin.PULL_UP)
 
@@ -48,6 +63,24 @@ class Board:
         """
         return self.on_switch.read_u16() > 20000
 
+    def get_battery_voltage(self) -> float:
+        """
+        Get the battery voltage. If the board was given an ADCSampler (as the default board is), this is filtered in the
+        background so sag from brief motor current spikes is smoothed out, and reading it never waits on the ADC.
+
+        :return: The voltage at VIN, in volts. Near 0 when the batteries are off
+        :rtype: float
+        """
+        if self.sampler is None:
+            return self.on_switch.read_u16() * self.vin_scale
+        return self._vin_filtered
+
+    def _update_vin(self):
+        """
+        Non-api method; updates the filtered battery voltage with the latest sample. Called by the ADCSampler
+        """
+        self._vin_filtered += self.vin_filter * (self.on_switch.read_u16() * self.vin_scale - self._vin_filtered)
+
     def is_button_pressed(self) -> bool:
         """
         Returns the state of the button
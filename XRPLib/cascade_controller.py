@@ -0,0 +1,50 @@
+from .controller import Controller
+
+class CascadeController(Controller):
+
+    def __init__(self, outer: Controller, inner: Controller, inner_measurement):
+        """
+        Chains two controllers, so that the output of the outer loop becomes the setpoint of the inner loop.
+        For example, an outer position loop can output a target speed, which a faster inner speed loop then tracks.
+
+        Use it anywhere a Controller is accepted, such as the main_controller of DifferentialDrive.straight().
+
+        :param outer: The outer controller, which is given the error passed to update()
+        :type outer: Controller
+        :param inner: The inner controller, which tracks the output of the outer controller
+        :type inner: Controller
+        :param inner_measurement: A function returning the current value of what the inner loop controls, in the same units as the outer controller's output
+        :type inner_measurement: function
+        """
+        self.outer = outer
+        self.inner = inner
+        self.inner_measurement = inner_measurement
+        self.inner_setpoint = 0
+
+    def update(self, error: float) -> float:
+        """
+        Handle a new update of both loops given the outer loop's error.
+
+        :param error: The error of the outer loop
+        :type error: float
+
+        :return: The output of the inner controller
+        :rtype: float
+        """
+        self.inner_setpoint = self.outer.update(error)
+        return self.inner.update(self.inner_setpoint - self.inner_measurement())
+
+    def is_done(self) -> bool:
+        """
+        :return: If the outer controller has settled
+        :rtype: bool
+        """
+        return self.outer.is_done()
+
+    def clear_history(self):
+        """
+        Clears the history of both controllers
+        """
+        self.outer.clear_history()
+        self.inner.clear_history()
+        self.inner_setpoint = 0
@@ -0,0 +1,123 @@
+from array import array
+
+"""
+Bank of PID controllers updated together
+"""
+
+class PIDBank:
+
+    def __init__(self,
+                 size: int,
+                 kp = 1.0,
+                 ki = 0.0,
+                 kd = 0.0,
+                 min_output = 0.0,
+                 max_output = 1.0,
+                 max_integral = None,
+                 timestep = 0.02
+                 ):
+        """
+        Runs several PID loops at once, with the gains and state of every loop stored in compact float arrays.
+        Each loop keeps its own integral and previous error, so loops never share state, and all of them are
+        updated with a single call. Intended for loops updated together at a fixed rate, such as the speed loops of a MotorGroup.
+
+        :param size: The number of loops in the bank
+        :param kp: proportional gain, used for every loop to start with
+        :param ki: integral gain, used for every loop to start with
+        :param kd: derivative gain, used for every loop to start with
+        :param min_output: minimum output
+        :param max_output: maximum output
+        :param max_integral: maximum integral windup allowed (will cap integral at this value)
+        :param timestep: fixed time between updates, in seconds
+        """
+        self.size = size
+        self.min_output = min_output
+        self.max_output = max_output
+        self.max_integral = max_integral
+        self.timestep = timestep
+
+        self.kp = array('f', [kp] * size)
+        self.ki = array('f', [ki] * size)
+        self.kd = array('f', [kd] * size)
+        # Derivative gain with the timestep divided in, so updates skip the divide
+        self._kd_over_timestep = array('f', [kd / timestep] * size)
+
+        self.integral = array('f', [0] * size)
+        self.prev_error = array('f', [0] * size)
+
+    def set_gains(self, index: int, kp: float, ki: float, kd: float):
+        """
+        Sets the gains of one loop in the bank
+
+        :param index: The loop to set the gains of
+        :type index: int
+        :param kp: proportional gain
+        :type kp: float
+        :param ki: integral gain
+        :type ki: float
+        :param kd: derivative gain
+        :type kd: float
+        """
+        self.kp[index] = kp
+        self.ki[index] = ki
+        self.kd[index] = kd
+        self._kd_over_timestep[index] = kd / self.timestep
+
+    def update(self, errors, outputs):
+        """
+        Updates every loop in the bank
+
+        :param errors: The error of each loop, indexed the same as the bank
+        :type errors: array
+        :param outputs: Where the output of each loop is written, indexed the same as the bank
+        :type outputs: array
+        :return: outputs
+        :rtype: array
+        """
+        # Local lookups are much cheaper than attribute lookups inside the loop
+        kp = self.kp
+        ki = self.ki
+        kd_over_timestep = self._kd_over_timestep
+        integrals = self.integral
+        prev_errors = self.prev_error
+        timestep = self.timestep
+        min_output = self.min_output
+        max_output = self.max_output
+        max_integral = self.max_integral
+
+        for i in range(self.size):
+            error = errors[i]
+
+            integral = integrals[i] + error * timestep
+            if max_integral is not None:
+                integral = max(-max_integral, min(max_integral, integral))
+            integrals[i] = integral
+
+            output = kp[i] * error + ki[i] * integral + kd_over_timestep[i] * (error - prev_errors[i])
+            prev_errors[i] = error
+
+            # Bound output by minimum
+            if output > 0:
+                output = max(min_output, output)
+            else:
+                output = min(-min_output, output)
+
+            # Bound output by maximum
+            outputs[i] = max(-max_output, min(max_output, output))
+
+        return outputs
+
+    def clear_history(self, index: int = None):
+        """
+        Clears the integral and previous error of one loop, or of every loop if no index is given
+
+        :param index: The loop to clear, or None for all of them
+        :type index: int
+        """
+        if index is None:
+            for i in range(self.size):
+                self.integral[i] = 0
+                self.prev_error[i] = 0
+        else:
+            self.integral[index] = 0
+            self.prev_error[index] = 0
@@ -1,10 +1,12 @@
 from .encoded_motor import EncodedMotor
 from .imu import IMU
 from .controller import Controller
-from .pid import PID
+from .pid import PID, AdvancedPID, GainScheduledPID
 from .timeout import Timeout
-import time
+from .rate_limiter import RateLimiter
+from .slip_detector import SlipDetector
 import math
+import gc
 
 class DifferentialDrive:
 
@@ -45,21 +47,80 @@ class DifferentialDrive:
         self.left_motor = left_motor
         self.right_motor = right_motor
         self.imu = imu
+        # Anything with get_yaw() and get_yaw_rate() methods, in degrees. Used by straight(), turn() and arcade()
+        self.heading_source = imu
 
         self.brake_at_zero_power = False
         self.wheel_diam = wheel_diam
         self.track_width = wheel_track
 
+        # Geometric conversion factors, cached so control loops don't recompute them every update
+        self._cm_per_rev = math.pi * wheel_diam
+        self._cmps_to_rpm = 60 / self._cm_per_rev
+        self._cm_to_degrees = 360 / (wheel_track * math.pi)
+
         self.heading_pid = None
         self.current_heading = None
         self.reset_heading = True
         self.turning = False
 
+        # Cross-checks the encoders against the IMU during straight(), turn() and arc().
+        # Off by default; turn it on with set_slip_detection()
+        self.slip_detector = None
+        # Effort is scaled by this while the wheels are slipping, to regain traction
+        self.slip_effort_scale = 0.6
+
         if self.imu:
             # if the IMU is initialized, then create a PID controller that can be used
             # to maintain a constant heading when driving
             self.heading_pid = PID( kp = 0.075, kd=0.001, )
 
+        # Default controllers for straight(), turn() and arc(). These are reset at the start of each
+        # move rather than rebuilt, so that starting a move doesn't allocate
+        self._straight_controller = AdvancedPID(
+            kp = 0.1,
+            ki = 0.04,
+            kd = 0.04,
+            min_output = 0.3,
+            max_integral = 10,
+            tolerance = 0.25,
+            tolerance_count = 3,
+        )
+        self._straight_heading_controller = PID(
+            kp = 0.075, kd=0.001,
+        )
+        # Faster turns need more damping; kd is scheduled by max_effort
+        self._turn_controller = GainScheduledPID(
+            [
+                # (max_effort, kp, ki, kd)
+                (0.5, 0.2, 0.004, 0.0036),
+                (1.0, 0.2, 0.004, 0.007),
+            ],
+            min_output = 0.1,
+            max_integral = 30,
+            tolerance = 1,
+            tolerance_count = 3,
+            # Keep the floor that turn() has always used
+            offset_min_output = False
+        )
+        self._turn_encoder_controller = PID(
+            kp = 0.25,
+        )
+        self._arc_controller = AdvancedPID(
+            kp = 0.1,
+            ki = 0.02,
+            min_output = 0.15,
+            max_output = 1,
+            max_integral = 10,
+            tolerance = 0.25,
+            tolerance_count = 3,
+        )
+        self._arc_sync_controller = PID(
+            kp = 2,
+        )
+        self._timeout = Timeout(None)
+        self._rate = RateLimiter(100)
+
     def set_effort(self, left_effort: float, right_effort: float) -> None:
         """
         Set the raw effort of both motors individually
@@ -83,9 +144,38 @@ class DifferentialDrive:
         :type rightSpeed: float
         """
         # Convert from cm/s to RPM
-        cmpsToRPM = 60 / (math.pi * self.wheel_diam)
-        self.left_motor.set_speed(left_speed*cmpsToRPM)
-        self.right_motor.set_speed(right_speed*cmpsToRPM)
+        self.left_motor.set_speed(left_speed*self._cmps_to_rpm)
+        self.right_motor.set_speed(right_speed*self._cmps_to_rpm)
+
+    def set_heading_source(self, heading_source):
+        """
+        Sets where straight(), turn() and arcade() get the robot's heading from. By default this is the IMU,
+        but a HeadingEstimator (or anything else with get_yaw() and get_yaw_rate() methods, in degrees) can be used instead.
+
+        :param heading_source: The new heading source, or None to use the encoders only
+        :type heading_source: IMU or HeadingEstimator
+        """
+        self.heading_source = heading_source
+        self.reset_heading = True
+        if heading_source is not None and self.heading_pid is None:
+            self.heading_pid = PID( kp = 0.075, kd=0.001, )
+
+    def set_slip_detection(self, enabled: bool = True):
+        """
+        Turns wheel slip detection on or off for straight(), turn() and arc(). While the wheels slip, effort is scaled by
+        slip_effort_scale to regain traction, and turn() falls back on the heading source. Needs the IMU.
+        For other settings, assign a SlipDetector to slip_detector directly.
+
+        :param enabled: True to detect slip, False to stop
+        :type enabled: bool
+        """
+        if enabled and self.imu is not None:
+            self.slip_detector = SlipDetector(self.left_motor, self.right_motor, self.imu, self.wheel_diam, self.track_width)
+        else:
+            if self.slip_detector is not None:
+                # The detector turned on the IMU's background accelerometer reads, which nothing needs any more
+                self.slip_detector.imu.set_background_acc(False)
+            self.slip_detector = None
 
     def set_zero_effort_behavior(self, brake_at_zero_effort):
 
@@ -121,7 +211,7 @@ class DifferentialDrive:
             left_speed = (straight - turn)*scale
             right_speed = (straight + turn)*scale
 
-            if not self.heading_pid:
+            if not self.heading_pid or self.heading_source is None:
                 # if not using IMU assist to maintain heading, just pass down the left and right motor
                 # speeds to control movement
                 self.set_effort(left_speed, right_speed)
@@ -137,10 +227,10 @@ class DifferentialDrive:
 
                     if self.reset_heading:
                         self.reset_heading = False
-                        self.current_heading = self.imu.get_yaw()
+                        self.current_heading = self.heading_source.get_yaw()
 
                     # use the PID to set the heading correction based on the current heading
-                    heading_correction = self.heading_pid.update(self.current_heading - self.imu.get_yaw())
+                    heading_correction = self.heading_pid.update(self.current_heading - self.heading_source.get_yaw())
 
                     self.set_effort(left_speed - heading_correction, right_speed + heading_correction)
                 else:
@@ -148,6 +238,21 @@ class DifferentialDrive:
                     self.turning = True
                     self.set_effort(left_speed, right_speed)
 
+    def curvature_drive(self, speed: float, curvature: float):
+        """
+        Drives the robot along a curve using the encoder speed loops, rather than raw effort.
+        This is non-blocking; call again to change the curve, or call stop() to end it.
+
+        :param speed: The speed of the center of the robot (In Centimeters per Second). Negative drives backwards
+        :type speed: float
+        :param curvature: The curvature of the path (1 / radius, in 1/Centimeters). Positive curves left (counterclockwise), negative curves right, and 0 drives straight
+        :type curvature: float
+        """
+        # Each wheel sits half a track width away from the center of the robot,
+        # so its path radius (and thus its speed) differs by that offset
+        offset = curvature * self.track_width / 2
+        self.set_speed(speed * (1 - offset), speed * (1 + offset))
+
     def reset_encoder_position(self) -> None:
         """
         Resets the position of both motors' encoders to 0
@@ -161,14 +266,14 @@ class DifferentialDrive:
         :return: the current position of the left motor's encoder in cm.
         :rtype: float
         """
-        return self.left_motor.get_position()*math.pi*self.wheel_diam
+        return self.left_motor.get_position()*self._cm_per_rev
 
     def get_right_encoder_position(self) -> float:
         """
         :return: the current position of the right motor's encoder in cm.
         :rtype: float
         """
-        return self.right_motor.get_position()*math.pi*self.wheel_diam
+        return self.right_motor.get_position()*self._cm_per_rev
 
 
     def straight(self, distance: float, max_effort: float = 0.5, timeout: float = None, main_controller: Controller = None, secondary_controller: Controller = None) -> bool:
@@ -194,35 +299,35 @@ class DifferentialDrive:
             max_effort *= -1
             distance *= -1
 
-        time_out = Timeout(timeout)
-        starting_left = self.get_left_encoder_position()
-        starting_right = self.get_right_encoder_position()
-
-
         if main_controller is None:
-            main_controller = PID(
-                kp = 0.1,
-                ki = 0.04,
-                kd = 0.04,
-                min_output = 0.3,
-                max_output = max_effort,
-                max_integral = 10,
-                tolerance = 0.25,
-                tolerance_count = 3,
-            )
+            main_controller = self._straight_controller
+            main_controller.max_output = max_effort
+            main_controller.clear_history()
 
         # Secondary controller to keep encoder values in sync
         if secondary_controller is None:
-            secondary_controller = PID(
-                kp = 0.075, kd=0.001,
-            )
+            secondary_controller = self._straight_heading_controller
+            secondary_controller.clear_history()
+
+        # Collect garbage now, so that a collection doesn't land in the middle of the move
+        gc.collect()
+
+        time_out = self._timeout
+        time_out.reset(timeout)
+        starting_left = self.get_left_encoder_position()
+        starting_right = self.get_right_encoder_position()
 
-        if self.imu is not None:
+        if self.heading_source is not None:
             # record current heading to maintain it
-            initial_heading = self.imu.get_yaw()
+            initial_heading = self.heading_source.get_yaw()
         else:
             initial_heading = 0
 
+        if self.slip_detector is not None:
+            self.slip_detector.reset()
+
+        rate = self._rate
+        rate.reset()
         while True:
 
             # calculate the distance traveled
@@ -237,18 +342,22 @@ class DifferentialDrive:
             if main_controller.is_done() or time_out.is_done():
                 break
 
+            if self.slip_detector is not None and self.slip_detector.update():
+                # back off to regain traction; distance is still measured by the encoders
+                effort *= self.slip_effort_scale
+
             # calculate heading correction
-            if self.imu is not None:
+            if self.heading_source is not None:
                 # record current heading to maintain it
-                current_heading = self.imu.get_yaw()
+                current_heading = self.heading_source.get_yaw()
             else:
-                current_heading = ((right_delta-left_delta)/2)*360/(self.track_width*math.pi)
+                current_heading = ((right_delta-left_delta)/2)*self._cm_to_degrees
 
             headingCorrection = secondary_controller.update(initial_heading - current_heading)
             
             self.set_effort(effort - headingCorrection, effort + headingCorrection)
 
-            time.sleep(0.01)
+            rate.sleep()
 
         self.stop()
 
@@ -271,7 +380,7 @@ class DifferentialDrive:
         :type main_controller: Controller
         :param secondary_controller: The secondary controller, for maintaining position during the turn by controlling the encoder count difference
         :type secondary_controller: Controller
-        :param use_imu: A boolean flag that changes if the main controller bases its movement off of the imu (True) or the encoders (False)
+        :param use_imu: A boolean flag that changes if the main controller bases its movement off of the heading source, which is the imu by default (True) or the encoders (False)
         :type use_imu: bool
         :return: if the distance was reached before the timeout
         :rtype: bool
@@ -281,35 +390,42 @@ class DifferentialDrive:
             max_effort = -max_effort
             turn_degrees = -turn_degrees
 
-        time_out = Timeout(timeout)
-        starting_left = self.get_left_encoder_position()
-        starting_right = self.get_right_encoder_position()
-
         if main_controller is None:
-            main_controller = PID(
-                # kp = 0.2,
-                # ki = 0.004,
-                # kd = 0.0036,
-                kd = 0.0036 + 0.0034 * (max(max_effort, 0.5) - 0.5) * 2,
-                kp = 0.2,
-                ki = 0.004,
-                #kd = 0.007,
-                min_output = 0.1,
-                max_output = max_effort,
-                max_integral = 30,
-                tolerance = 1,
-                tolerance_count = 3
-            )
+            main_controller = self._turn_controller
+            main_controller.set_operating_point(max_effort)
+            main_controller.max_output = max_effort
+            main_controller.clear_history()
 
         # Secondary controller to keep encoder values in sync
         if secondary_controller is None:
-            secondary_controller = PID(
-                kp = 0.25,
-            )
- 
-        if use_imu and (self.imu is not None):
-            turn_degrees += self.imu.get_yaw()
+            secondary_controller = self._turn_encoder_controller
+            secondary_controller.clear_history()
+
+        # Collect garbage now, so that a collection doesn't land in the middle of the move
+        gc.collect()
+
+        time_out = self._timeout
+        time_out.reset(timeout)
+        starting_left = self.get_left_encoder_position()
+        starting_right = self.get_right_encoder_position()
+
+        if self.heading_source is not None:
+            starting_yaw = self.heading_source.get_yaw()
 
+        if use_imu and (self.heading_source is not None):
+            turn_degrees += starting_yaw
+
+        # The library's PID controllers can take the measured yaw rate for their derivative term, rather than differencing the error.
+        # Subclasses may override update() without it, so they only get the error
+        measured_derivative = type(main_controller) in (PID, AdvancedPID, GainScheduledPID)
+
+        # Set once the wheels slip, after which the encoders can no longer be trusted for heading
+        imu_fallback = False
+        if self.slip_detector is not None:
+            self.slip_detector.reset()
+
+        rate = self._rate
+        rate.reset()
         while True:
             
             # calculate encoder correction to minimize drift
@@ -317,23 +433,140 @@ class DifferentialDrive:
             right_delta = self.get_right_encoder_position() - starting_right
             encoder_correction = secondary_controller.update(left_delta + right_delta)
 
-            if use_imu and (self.imu is not None):
+            slipping = self.slip_detector is not None and self.slip_detector.update()
+            if slipping and (self.heading_source is not None):
+                imu_fallback = True
+
+            if use_imu and (self.heading_source is not None):
                 # calculate turn error (in degrees) from the imu
-                turn_error = turn_degrees - self.imu.get_yaw()
+                turn_error = turn_degrees - self.heading_source.get_yaw()
+                turn_error_rate = -self.heading_source.get_yaw_rate()
+            elif imu_fallback:
+                # calculate turn error (in degrees) from the imu, relative to where the turn started
+                turn_error = turn_degrees - (self.heading_source.get_yaw() - starting_yaw)
+                turn_error_rate = -self.heading_source.get_yaw_rate()
             else:
                 # calculate turn error (in degrees) from the encoder counts
-                turn_error = turn_degrees - ((right_delta-left_delta)/2)*360/(self.track_width*math.pi)
+                turn_error = turn_degrees - ((right_delta-left_delta)/2)*self._cm_to_degrees
+                turn_error_rate = None
 
             # Pass the turn error to the main controller to get a turn speed
-            turn_speed = main_controller.update(turn_error)
+            if measured_derivative and turn_error_rate is not None:
+                turn_speed = main_controller.update(turn_error, error_rate=turn_error_rate)
+            else:
+                turn_speed = main_controller.update(turn_error)
 
             # exit if timeout or tolerance reached
             if main_controller.is_done() or time_out.is_done():
                 break
 
+            if slipping:
+                turn_speed *= self.slip_effort_scale
+
             self.set_effort(-turn_speed - encoder_correction, turn_speed - encoder_correction)
 
-            time.sleep(0.01)
+            rate.sleep()
+
+        self.stop()
+
+        return not time_out.is_done()
+
+
+    def arc(self, radius: float, angle: float, speed: float = 20, timeout: float = None, main_controller: Controller = None, secondary_controller: Controller = None) -> bool:
+        """
+        Drive the robot along an arc of a given radius until it has turned the given angle, and exit function when the arc is complete.
+        Both wheels are driven with the encoder speed loops, and the arc finishes by closing on the final wheel positions.
+
+        :param radius: The radius of the arc, measured to the center of the robot (In Centimeters). A radius of 0 turns in place
+        :type radius: float
+        :param angle: The angle for the robot to turn along the arc (In Degrees). Positive arcs left (counterclockwise), negative arcs right
+        :type angle: float
+        :param speed: The cruising speed of the outer wheel (In Centimeters per Second). Negative drives the arc backwards
+        :type speed: float
+        :param timeout: The amount of time before the robot stops trying to drive the arc and continues to the next step (In Seconds)
+        :type timeout: float
+        :param main_controller: The main controller, for handling the distance left along the arc. Its output scales the cruising speed
+        :type main_controller: Controller
+        :param secondary_controller: The secondary controller, for keeping both wheels at the same fraction of their path
+        :type secondary_controller: Controller
+        :return: if the arc was completed before the timeout
+        :rtype: bool
+        """
+        radius = abs(radius)
+        if speed < 0:
+            # driving backwards along the arc mirrors the heading change
+            speed = -speed
+            direction = -1
+            angle = -angle
+        else:
+            direction = 1
+
+        # Distance each wheel needs to travel, in cm
+        angle_rad = math.radians(angle)
+        left_target = direction * (radius * abs(angle_rad) - angle_rad * self.track_width / 2)
+        right_target = direction * (radius * abs(angle_rad) + angle_rad * self.track_width / 2)
+        outer_target = max(abs(left_target), abs(right_target))
+        if outer_target == 0:
+            return True
+
+        # Cruising wheel speeds (in cm/s), so that both wheels finish at the same time
+        left_cruise = speed * left_target / outer_target
+        right_cruise = speed * right_target / outer_target
+
+        if main_controller is None:
+            main_controller = self._arc_controller
+            main_controller.clear_history()
+
+        # Secondary controller to keep both wheels at the same point along the arc
+        if secondary_controller is None:
+            secondary_controller = self._arc_sync_controller
+            secondary_controller.max_output = speed
+            secondary_controller.clear_history()
+
+        # Collect garbage now, so that a collection doesn't land in the middle of the move
+        gc.collect()
+
+        time_out = self._timeout
+        time_out.reset(timeout)
+        starting_left = self.get_left_encoder_position()
+        starting_right = self.get_right_encoder_position()
+
+        if self.slip_detector is not None:
+            self.slip_detector.reset()
+
+        rate = self._rate
+        rate.reset()
+        while True:
+
+            left_delta = self.get_left_encoder_position() - starting_left
+            right_delta = self.get_right_encoder_position() - starting_right
+
+            # Progress is measured along the outer wheel's path, which is never zero
+            if abs(left_target) >= abs(right_target):
+                distance_error = (left_target - left_delta) * (1 if left_target > 0 else -1)
+            else:
+                distance_error = (right_target - right_delta) * (1 if right_target > 0 else -1)
+
+            speed_scale = main_controller.update(distance_error)
+
+            if main_controller.is_done() or time_out.is_done():
+                break
+
+            if self.slip_detector is not None and self.slip_detector.update():
+                speed_scale *= self.slip_effort_scale
+
+            # Distance the wheels have drifted off the ratio of their targets. Positive when the
+            # left wheel is further along its path than the right wheel
+            sync_error = (left_delta * right_target - right_delta * left_target) / outer_target
+            sync_correction = secondary_controller.update(sync_error)
+
+            # Push back across the drift, which is along (right_target, -left_target)
+            self.set_speed(
+                left_cruise * speed_scale - sync_correction * right_target / outer_target,
+                right_cruise * speed_scale + sync_correction * left_target / outer_target
+            )
+
+            rate.sleep()
 
         self.stop()
 
@@ -3,6 +3,9 @@ from .encoder import Encoder
 from machine import Timer
 from .controller import Controller
 from .pid import PID
+from .controller_bank import PIDBank
+from .board import Board
+from array import array
 import sys
 
 class EncodedMotor:
@@ -15,6 +18,116 @@ class EncodedMotor:
     _DEFAULT_MOTOR_THREE_INSTANCE = None
     _DEFAULT_MOTOR_FOUR_INSTANCE = None
 
+    # All motors (and motor groups) are updated from one shared timer, so they update together
+    _UPDATE_PERIOD_MS = 20
+    _DEFAULT_SPEED_MAX_INTEGRAL = 50
+    _update_timer = None
+    _update_list = []
+    # Every real motor, which the output stage works on. Motor groups are updated on the tick too,
+    # but write through their motors, so they aren't in here
+    _motor_list = []
+    # Motors whose outputs are written at the end of each tick, along with a buffer for their efforts.
+    # Swapped as a whole so the timer never sees the two out of step
+    _outputs = ((), array('f'))
+    # The default speed loops of every motor, run together from one PIDBank: (motors, bank, errors, efforts).
+    # Also swapped as a whole
+    _speed_loops = ((), PIDBank(0), array('f'), array('f'))
+    _synchronized_output = False
+
+    @classmethod
+    def _register_update(cls, updatable):
+        """
+        Non-api method; adds an object with an _update() method to the shared update tick.
+        Objects are updated in the order they were registered.
+        """
+        cls._update_list.append(updatable)
+        if cls._update_timer is None:
+            # Use a virtual timer so we can leave the hardware timers up for the user
+            cls._update_timer = Timer(-1)
+            # Start it at 50 Hz (20ms updates)
+            cls._update_timer.init(period=cls._UPDATE_PERIOD_MS, callback=lambda t:cls._update_all())
+
+    @classmethod
+    def _update_all(cls):
+        """
+        Non-api method; runs one tick of the shared update
+        """
+        for updatable in cls._update_list:
+            updatable._update()
+        # Motors running their default speed loop all update together from the bank, once their speeds are in
+        motors, bank, errors, efforts = cls._speed_loops
+        count = len(motors)
+        for i in range(count):
+            target_speed = motors[i].target_speed
+            # Idle loops get no error, so they hold their state until speed control is turned back on
+            errors[i] = 0 if target_speed is None else target_speed - motors[i].speed
+        bank.update(errors, efforts)
+        for i in range(count):
+            motor = motors[i]
+            if motor.target_speed is not None:
+                motor._write_effort(efforts[i])
+        # Outputs go last, so efforts set by anything earlier in the tick are applied in the same tick.
+        # Every output is worked out first and then written back to back, so the motors all change together
+        motors, efforts = cls._outputs
+        count = len(motors)
+        for i in range(count):
+            efforts[i] = motors[i]._compute_output()
+        for i in range(count):
+            motor = motors[i]
+            if not motor._braking:
+                motor._motor.set_effort(efforts[i])
+
+    @classmethod
+    def set_synchronized_output(cls, synchronized: bool = True):
+        """
+        Collects the efforts of every motor and writes them all together at the end of each tick of the 50 Hz update,
+        instead of writing each one as soon as it is set. The motors then change at the same moment,
+        such as both wheels of the drivetrain, at the cost of up to one tick of delay.
+
+        :param synchronized: True to write all motor outputs together, False to write them as soon as they are set
+        :type synchronized: bool
+        """
+        cls._synchronized_output = synchronized
+        for motor in cls._motor_list:
+            motor._refresh_output_stage()
+
+    @classmethod
+    def stop_all(cls):
+        """
+        Turns off speed control and sets the effort to zero on every motor and motor group, such as when a program is stopped.
+        Motor groups set their motors' efforts themselves on every update, so stopping only the motors doesn't stop a group.
+        """
+        for updatable in cls._update_list:
+            updatable.set_speed()
+
+    @classmethod
+    def _rebuild_speed_loops(cls):
+        """
+        Non-api method; rebuilds the bank that runs the default speed loop of every motor using it.
+        Each loop takes its gains from the motor's DEFAULT_SPEED_CONTROLLER and keeps its state from the old bank
+        """
+        motors = tuple(motor for motor in cls._motor_list if motor._bank_speed_control)
+        old_motors, old_bank = cls._speed_loops[:2]
+        count = len(motors)
+        bank = PIDBank(count, max_integral=cls._DEFAULT_SPEED_MAX_INTEGRAL, timestep=cls._UPDATE_PERIOD_MS / 1000)
+        for i in range(count):
+            motor = motors[i]
+            controller = motor.DEFAULT_SPEED_CONTROLLER
+            bank.set_gains(i, controller.kp, controller.ki, controller.kd)
+            if motor in old_motors:
+                j = old_motors.index(motor)
+                bank.integral[i] = old_bank.integral[j]
+                bank.prev_error[i] = old_bank.prev_error[j]
+        cls._speed_loops = (motors, bank, array('f', [0] * count), array('f', [0] * count))
+
+    @classmethod
+    def _rebuild_outputs(cls):
+        """
+        Non-api method; rebuilds the list of motors whose outputs are written at the end of each tick
+        """
+        motors = tuple(motor for motor in cls._motor_list if motor._defer_output)
+        cls._outputs = (motors, array('f', [0] * len(motors)))
+
     @classmethod
     def get_default_encoded_motor(cls, index:int = 1):
         """
@@ -74,15 +187,31 @@ class EncodedMotor:
             kp=0.035,
             ki=0.03,
             kd=0,
-            max_integral=50
+            max_integral=EncodedMotor._DEFAULT_SPEED_MAX_INTEGRAL,
+            # Updated by the 50 Hz update timer, so the timestep is known
+            timestep=0.02
         )
         self.speedController = self.DEFAULT_SPEED_CONTROLLER
+        # The default speed loop runs in the shared bank instead of from the PID object itself
+        self._bank_speed_control = True
         self.prev_position = 0
         self.speed = 0
-        # Use a virtual timer so we can leave the hardware timers up for the user
-        self.updateTimer = Timer(-1)
-        # If the update timer is not running, start it at 50 Hz (20ms updates)
-        self.updateTimer.init(period=20, callback=lambda t:self._update())
+        # Battery voltage compensation, off until set_voltage_compensation() is called
+        self._compensation_board = None
+        self.nominal_voltage = None
+        self.min_compensation_voltage = 3.0
+        # Output stage, off until set_output_limits() or set_synchronized_output() is called
+        self._limit_output = False
+        self._defer_output = False
+        self._max_step = None
+        self.current_limit = None
+        self._requested_effort = 0
+        self._output_effort = 0
+        self._braking = False
+        EncodedMotor._register_update(self)
+        EncodedMotor._motor_list.append(self)
+        EncodedMotor._rebuild_speed_loops()
+        self._refresh_output_stage()
 
 
     def set_effort(self, effort: float):
@@ -93,7 +222,89 @@ class EncodedMotor:
         if self.brake_at_zero and effort == 0:
             self.brake()
         else:
+            self._write_effort(effort)
+
+    def set_voltage_compensation(self, nominal_voltage: float = 5.0, board: Board = None):
+        """
+        Scales every effort by the nominal voltage over the battery voltage, so that an effort means a fraction of the
+        nominal voltage rather than a fraction of whatever the batteries happen to give. The robot then drives the same on
+        fresh and tired batteries, and tuned gains stay valid as the batteries run down. Efforts are still capped at 1,
+        so full effort can't go beyond what the batteries can give.
+
+        The battery voltage comes from the filtered background reading of the board, so this adds no ADC reads.
+
+        :param nominal_voltage: The battery voltage that an effort of 1 corresponds to, in volts. None turns compensation off
+        :type nominal_voltage: float
+        :param board: The board to read the battery voltage from. Defaults to the default board
+        :type board: Board
+        """
+        if nominal_voltage is None:
+            self._compensation_board = None
+        elif board is None:
+            self._compensation_board = Board.get_default_board()
+        else:
+            self._compensation_board = board
+        self.nominal_voltage = nominal_voltage
+
+    def _write_effort(self, effort: float):
+        """
+        Non-api method; sends an effort to the motor driver, compensating for the battery voltage if enabled
+        """
+        board = self._compensation_board
+        if board is not None:
+            voltage = board.get_battery_voltage()
+            # Below this the batteries are off or flat, and there is nothing sensible to compensate for
+            if voltage > self.min_compensation_voltage:
+                effort = max(-1, min(1, effort * self.nominal_voltage / voltage))
+        self._braking = False
+        self._requested_effort = effort
+        if not self._defer_output:
             self._motor.set_effort(effort)
+
+    def _refresh_output_stage(self):
+        """
+        Non-api method; works out whether efforts are written straight away or at the end of each tick
+        """
+        defer_output = self._limit_output or EncodedMotor._synchronized_output
+        if defer_output and not self._defer_output:
+            self._output_effort = self._requested_effort
+        self._defer_output = defer_output
+        EncodedMotor._rebuild_outputs()
+
+    def _compute_output(self) -> float:
+        """
+        Non-api method; limits the most recently requested effort. Called at the end of each update tick, before the outputs are written
+        """
+        if self._braking:
+            return 0
+        effort = self._requested_effort
+        output = self._output_effort
+
+        max_step = self._max_step
+        if max_step is not None:
+            effort = max(output - max_step, min(output + max_step, effort))
+
+        if self.current_limit is not None:
+            # Back EMF cancels out the part of the effort that matches the current speed, and current flows from the rest
+            back_emf = self.get_speed() / self.free_speed
+            headroom = self.current_limit / self.stall_current
+            board = self._compensation_board
+            if board is not None:
+                # The motor figures are for the nominal voltage; a different battery voltage changes the effort they come out to
+                voltage = board.get_battery_voltage()
+                if voltage > self.min_compensation_voltage:
+                    scale = self.nominal_voltage / voltage
+                    back_emf *= scale
+                    headroom *= scale
+            # Too much current comes from an effort well above the back EMF, or from reversing, so only those are cut,
+            # and only back towards zero. Stopping, coasting and easing off always get through
+            if effort > 0:
+                effort = min(effort, max(0, back_emf + headroom))
+            elif effort < 0:
+                effort = max(effort, min(0, back_emf - headroom))
+
+        self._output_effort = effort
+        return effort
     
     # EncodedMotor.set_zero_effort_behavior(EncodedMotor.ZERO_POWER_BRAKE)
     def set_zero_effort_behavior(self, brake_at_zero_effort):
@@ -108,6 +319,10 @@ class EncodedMotor:
         """
         Causes the motor to resist rotation.
         """
+        # Stop the output stage from overwriting the brake
+        self._braking = True
+        self._requested_effort = 0
+        self._output_effort = 0
         # Exact impl of brake depends on which board is being used. 
         self._motor.brake()
 
@@ -115,8 +330,68 @@ class EncodedMotor:
         """
         Allows the motor to spin freely.
         """
+        # Coasting is immediate, even with a slew limit
+        self._braking = False
+        self._requested_effort = 0
+        self._output_effort = 0
         self._motor.coast()
 
+    def set_output_limits(self, slew_rate: float = None, current_limit: float = None, free_speed: float = 100, stall_current: float = 1.6):
+        """
+        Limits how the motor's output can change, to protect the gearbox, keep traction and avoid brownouts.
+        Once set, efforts are no longer written straight away; the most recent one is limited and written on the
+        next tick of the 50 Hz update, so setting an effort stays cheap. Call with no parameters to turn the limits off.
+
+        The current is estimated from the effort, the speed and the battery voltage with a simple DC motor model:
+        current grows with the difference between the effort and the fraction of free speed the motor is turning at.
+
+        :param slew_rate: The most the output may change by in one second, in effort per second. None for no slew limit
+        :type slew_rate: float
+        :param current_limit: The most current the motor may draw, in amps. None for no current limit
+        :type current_limit: float
+        :param free_speed: The motor's speed with no load at full effort, in rpm
+        :type free_speed: float
+        :param stall_current: The current the motor draws when stalled at full effort, in amps
+        :type stall_current: float
+        """
+        self._max_step = None if slew_rate is None else slew_rate * EncodedMotor._UPDATE_PERIOD_MS / 1000
+        self.current_limit = current_limit
+        self.free_speed = free_speed
+        self.stall_current = stall_current
+        self._limit_output = slew_rate is not None or current_limit is not None
+        self._refresh_output_stage()
+
+    def set_pwm_frequency(self, frequency: int):
+        """
+        Sets the PWM frequency of the motor driver. The default of 50 Hz is audible and gives lumpy torque at low effort;
+        frequencies of 10-20 kHz are silent and smoother. Note that pins sharing a PWM slice share a frequency
+
+        :param frequency: The PWM frequency, in Hz
+        :type frequency: int
+        """
+        self._motor.set_pwm_frequency(frequency)
+
+    def set_linearization(self, deadband: float = 0.0, speed_curve: list = None, size: int = 33):
+        """
+        Reshapes efforts before they reach the motor, so that effort maps linearly to wheel speed.
+        The mapping is precomputed into a table, so applying it costs one lookup per effort written
+
+        :param deadband: The smallest effort that makes the motor turn. Any non-zero effort starts from here. Ignored if a speed_curve is given
+        :type deadband: float
+        :param speed_curve: Measured wheel speeds, in any units, at evenly spaced efforts from 0 to 1 inclusive. Must be increasing.
+            The deadband is taken from the curve itself
+        :type speed_curve: list<float>
+        :param size: The number of entries in the precomputed table
+        :type size: int
+        """
+        self._motor.set_linearization(deadband, speed_curve, size)
+
+    def clear_linearization(self):
+        """
+        Stops reshaping efforts, so they go straight to the motor
+        """
+        self._motor.clear_linearization()
+
     def get_position(self) -> float:
         """
         :return: The position of the encoded motor, in revolutions, relative to the last time reset was called.
@@ -170,13 +445,20 @@ class EncodedMotor:
 
     def set_speed_controller(self, new_controller: Controller):
         """
-        Sets a new controller for speed control
+        Sets a new controller for speed control. Setting DEFAULT_SPEED_CONTROLLER again goes back to the default loop,
+        with any changes made to its gains
 
         :param new_controller: The new Controller for speed control
         :type new_controller: Controller
         """
         self.speedController = new_controller
         self.speedController.clear_history()
+        self._bank_speed_control = new_controller is self.DEFAULT_SPEED_CONTROLLER
+        EncodedMotor._rebuild_speed_loops()
+        if self._bank_speed_control:
+            # Start the default loop afresh, as a newly set controller would
+            motors, bank = EncodedMotor._speed_loops[:2]
+            bank.clear_history(motors.index(self))
 
     def _update(self):
         """
@@ -184,8 +466,8 @@ class EncodedMotor:
         """
         current_position = self.get_position_counts()
         self.speed = current_position - self.prev_position
-        if self.target_speed is not None:
+        if self.target_speed is not None and not self._bank_speed_control:
             error = self.target_speed - self.speed
             effort = self.speedController.update(error)
-            self._motor.set_effort(effort)
+            self._write_effort(effort)
         self.prev_position = current_position
\ No newline at end of file
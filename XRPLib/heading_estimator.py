@@ -0,0 +1,172 @@
+from .encoded_motor import EncodedMotor
+from .imu import IMU
+from machine import Timer, disable_irq, enable_irq
+import math
+
+class HeadingEstimator:
+
+    _DEFAULT_HEADING_ESTIMATOR_INSTANCE = None
+
+    @classmethod
+    def get_default_heading_estimator(cls):
+        """
+        Get the default XRP heading estimator instance. This is a singleton, so only one instance of the heading estimator will ever exist.
+        """
+        if cls._DEFAULT_HEADING_ESTIMATOR_INSTANCE is None:
+            cls._DEFAULT_HEADING_ESTIMATOR_INSTANCE = cls(
+                EncodedMotor.get_default_encoded_motor(index=1),
+                EncodedMotor.get_default_encoded_motor(index=2),
+                IMU.get_default_imu()
+            )
+        return cls._DEFAULT_HEADING_ESTIMATOR_INSTANCE
+
+    def __init__(self, left_motor: EncodedMotor, right_motor: EncodedMotor, imu: IMU, wheel_diam: float = 6.0, wheel_track: float = 15.5,
+                 update_freq: int = 100, gyro_noise: float = 0.5, bias_noise: float = 0.01, encoder_noise: float = 4.0, slip_gate: float = 5.0):
+        """
+        Estimates the heading of the robot with a small Kalman filter that fuses the yaw rate from the gyro with the
+        yaw rate from the difference between the wheel encoders, and estimates the gyro's bias as it goes.
+        Updates run in the background on a virtual timer.
+
+        Can be given to DifferentialDrive.set_heading_source() in place of the IMU.
+
+        :param left_motor: The left motor of the drivetrain
+        :type left_motor: EncodedMotor
+        :param right_motor: The right motor of the drivetrain
+        :type right_motor: EncodedMotor
+        :param imu: The IMU of the robot
+        :type imu: IMU
+        :param wheel_diam: The diameter of the wheels in cm
+        :type wheel_diam: float
+        :param wheel_track: The distance between the wheels in cm
+        :type wheel_track: float
+        :param update_freq: How often to update the estimate, in Hz
+        :type update_freq: int
+        :param gyro_noise: How much the heading is expected to wander from gyro noise, in degrees per root second
+        :type gyro_noise: float
+        :param bias_noise: How much the gyro bias is expected to wander, in degrees per second per root second
+        :type bias_noise: float
+        :param encoder_noise: The standard deviation of the encoder yaw rate, in degrees per second
+        :type encoder_noise: float
+        :param slip_gate: Encoder readings more than this many standard deviations away from the prediction are treated as wheel slip and ignored
+        :type slip_gate: float
+        """
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.imu = imu
+
+        self.timestep = 1 / update_freq
+        # Converts a difference in encoder counts into degrees of robot rotation
+        self._counts_to_degrees = math.degrees(math.pi * wheel_diam / (left_motor._encoder.resolution * wheel_track))
+
+        # Process and measurement noise, as variances
+        self._q_heading = gyro_noise * gyro_noise * self.timestep
+        self._q_bias = bias_noise * bias_noise * self.timestep
+        self._r_encoder = encoder_noise * encoder_noise
+        self._gate = slip_gate * slip_gate
+
+        self.reset(imu.get_yaw())
+
+        self.update_timer = Timer(-1)
+        self.update_timer.init(freq=update_freq, callback=lambda t:self._update())
+
+    def reset(self, yaw: float = 0):
+        """
+        Resets the heading to the given angle, and forgets the bias estimate
+
+        :param yaw: The yaw to reset to, in degrees
+        :type yaw: float
+        """
+        state = disable_irq()
+        self.yaw = yaw
+        self.gyro_bias = 0
+        # Covariance of [yaw, bias]
+        self._p00 = 0
+        self._p01 = 0
+        self._p11 = 1
+        self.prev_left = self.left_motor.get_position_counts()
+        self.prev_right = self.right_motor.get_position_counts()
+        self.encoder_rejected = False
+        enable_irq(state)
+
+    def get_yaw(self) -> float:
+        """
+        Get the estimated yaw (heading) of the robot in degrees. Unbounded in range
+
+        :return: The yaw (heading) of the robot in degrees
+        :rtype: float
+        """
+        return self.yaw
+
+    def get_yaw_rate(self) -> float:
+        """
+        :return: The yaw rate from the gyro, corrected by the estimated bias, in degrees per second
+        :rtype: float
+        """
+        return self.imu.get_yaw_rate() - self.gyro_bias
+
+    def get_heading(self) -> float:
+        """
+        :return: The estimated heading of the robot in degrees, bound between [0, 360)
+        :rtype: float
+        """
+        return self.yaw % 360
+
+    def set_yaw(self, yaw: float):
+        """
+        Set the yaw (heading) to a specific angle in degrees, keeping the bias estimate
+
+        :param yaw: The yaw to set the estimate to
+        :type yaw: float
+        """
+        self.yaw = yaw
+
+    def get_gyro_bias(self) -> float:
+        """
+        :return: The current estimate of the gyro's yaw rate bias, in degrees per second
+        :rtype: float
+        """
+        return self.gyro_bias
+
+    def _update(self):
+        """
+        Non-api method; runs one predict and correct step of the filter
+        """
+        dt = self.timestep
+
+        gyro_rate = self.imu.get_yaw_rate()
+
+        left = self.left_motor.get_position_counts()
+        right = self.right_motor.get_position_counts()
+        encoder_rate = ((right - self.prev_right) - (left - self.prev_left)) * self._counts_to_degrees / dt
+        self.prev_left = left
+        self.prev_right = right
+
+        # Predict: the heading integrates the bias-corrected gyro, and the bias is a random walk
+        p00 = self._p00
+        p01 = self._p01
+        p11 = self._p11
+        yaw = self.yaw + (gyro_rate - self.gyro_bias) * dt
+        p00 = p00 - 2 * dt * p01 + dt * dt * p11 + self._q_heading
+        p01 = p01 - dt * p11
+        p11 = p11 + self._q_bias
+
+        # Correct: the encoders measure the true yaw rate, which the model says is gyro_rate - bias
+        innovation = encoder_rate - (gyro_rate - self.gyro_bias)
+        s = p11 + self._r_encoder
+        if innovation * innovation > self._gate * s:
+            # The wheels disagree too much with the gyro to be believed, most likely from slip
+            self.encoder_rejected = True
+        else:
+            self.encoder_rejected = False
+            k0 = -p01 / s
+            k1 = -p11 / s
+            yaw += k0 * innovation
+            self.gyro_bias += k1 * innovation
+            p00 = p00 + k0 * p01
+            p01 = p01 + k0 * p11
+            p11 = (1 + k1) * p11
+
+        self._p00 = p00
+        self._p01 = p01
+        self._p11 = p11
+        self.yaw = yaw
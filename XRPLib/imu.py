@@ -32,6 +32,9 @@ class IMU():
         # I2C values
         self.i2c = I2C(id=1, scl=Pin(scl_pin), sda=Pin(sda_pin), freq=400000)
         self.addr = addr
+        # If the update timer also reads the accelerometer, so get_last_acc_rates() is kept up to date.
+        # Kept across resets, since whatever turned it on still needs it
+        self.background_acc = False
 
         # Initialize member variables
         self._reset_member_variables()
@@ -328,6 +331,35 @@ class IMU():
         """
         return self.running_yaw
     
+    def get_yaw_rate(self):
+        """
+        Get the yaw rate most recently read by the background update timer, without another I2C read
+
+        :return: The yaw rate of the IMU in degrees per second
+        :rtype: float
+        """
+        return self.irq_v[1][2] / 1000
+
+    def set_background_acc(self, enabled: bool = True):
+        """
+        Sets whether the background update timer also reads the accelerometer, in the same I2C burst as the gyro.
+        This lets control loops use get_last_acc_rates() instead of waiting on an I2C read of their own
+
+        :param enabled: True to read the accelerometer in the background
+        :type enabled: bool
+        """
+        self.background_acc = enabled
+
+    def get_last_acc_rates(self):
+        """
+        Get the accelerometer readings most recently read by the background update timer, without another I2C read.
+        Only kept up to date after set_background_acc() is called
+
+        :return: the list of readings from the Accelerometer, in mg. The order of the values is x, y, z.
+        :rtype: list<int>
+        """
+        return self.irq_v[0]
+
     def get_heading(self):
         """
         Get's the heading of the IMU, but bounded between [0, 360)
@@ -547,7 +579,10 @@ class IMU():
 
     def _update_imu_readings(self):
         # Called every tick through a callback timer
-        self.get_gyro_rates()
+        if self.background_acc:
+            self.get_acc_gyro_rates()
+        else:
+            self.get_gyro_rates()
         delta_pitch = self.irq_v[1][0] / 1000 / self.timer_frequency
         delta_roll = self.irq_v[1][1] / 1000 / self.timer_frequency
         delta_yaw = self.irq_v[1][2] / 1000 / self.timer_frequency
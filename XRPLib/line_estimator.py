@@ -0,0 +1,163 @@
+from .reflectance import Reflectance
+from machine import Timer
+
+class LineEstimator:
+
+    _DEFAULT_LINE_ESTIMATOR_INSTANCE = None
+
+    @classmethod
+    def get_default_line_estimator(cls):
+        """
+        Get the default XRP line estimator instance. This is a singleton, so only one instance of the line estimator will ever exist.
+        """
+        if cls._DEFAULT_LINE_ESTIMATOR_INSTANCE is None:
+            cls._DEFAULT_LINE_ESTIMATOR_INSTANCE = cls(Reflectance.get_default_reflectance())
+        return cls._DEFAULT_LINE_ESTIMATOR_INSTANCE
+
+    def __init__(self, reflectance: Reflectance, lost_threshold: float = 0.3, intersection_threshold: float = 0.7,
+                 detection_count: int = 3, update_freq: int = 200):
+        """
+        Estimates where the line is under the robot from the pair of reflectance sensors, as a single continuous
+        position, along with how sure it is. When the line is lost, the position holds at the side the line was last
+        seen on, so the robot turns back towards it. Intersections and the end of the line are also detected.
+
+        If the reflectance sensor reads through an ADCSampler, the estimate is updated every time the sampler has
+        new readings. Otherwise, it is updated on its own virtual timer. Works best with a calibrated reflectance sensor.
+
+        :param reflectance: The reflectance sensor to estimate from
+        :type reflectance: Reflectance
+        :param lost_threshold: If neither sensor reads above this, the line is lost
+        :type lost_threshold: float
+        :param intersection_threshold: If both sensors read above this, the robot is over an intersection
+        :type intersection_threshold: float
+        :param detection_count: The number of consecutive updates an intersection or line end must be seen for before it is reported
+        :type detection_count: int
+        :param update_freq: How often to update the estimate, in Hz, when there is no ADCSampler to follow
+        :type update_freq: int
+        """
+        self.reflectance = reflectance
+        self.lost_threshold = lost_threshold
+        self.intersection_threshold = intersection_threshold
+        self.detection_count = detection_count
+
+        self.reset()
+
+        if reflectance.sampler is not None:
+            reflectance.sampler.add_round_callback(self._update)
+        else:
+            self.update_timer = Timer(-1)
+            self.update_timer.init(freq=update_freq, callback=lambda t:self._update())
+
+    def reset(self):
+        """
+        Forgets which side the line was last seen on, and clears the intersection count
+        """
+        self.position = 0.0
+        self.confidence = 0.0
+        self.last_side = 0
+        self.line_lost = True
+        self.intersection = False
+        self.line_end = False
+        self.intersection_count = 0
+        self._intersection_times = 0
+        self._lost_times = 0
+        # Where the line was on the last update it was seen, to tell running off the end from overshooting
+        self._last_seen_position = 0.0
+        self._tracking = False
+
+    def get_position(self) -> float:
+        """
+        Get the position of the line relative to the centre of the sensors. Can be used directly as the error of a line follower
+
+        :return: The position of the line, from -1 (under the right sensor) to 1 (under the left sensor), and 0 when centred.
+            When the line is lost, -1 or 1 for the side it was last seen on
+        :rtype: float
+        """
+        return self.position
+
+    def get_confidence(self) -> float:
+        """
+        :return: How strongly the line is seen, from 0 (not at all) to 1 (fully under a sensor)
+        :rtype: float
+        """
+        return self.confidence
+
+    def get_last_side(self) -> int:
+        """
+        :return: The side the line was last seen on: 1 for left, -1 for right, or 0 if it hasn't been seen off centre yet
+        :rtype: int
+        """
+        return self.last_side
+
+    def is_line_lost(self) -> bool:
+        """
+        :return: If neither sensor can see the line
+        :rtype: bool
+        """
+        return self.line_lost
+
+    def is_intersection(self) -> bool:
+        """
+        :return: If both sensors are over the line at once, as when crossing another line
+        :rtype: bool
+        """
+        return self.intersection
+
+    def get_intersection_count(self) -> int:
+        """
+        :return: The number of intersections crossed since the last reset
+        :rtype: int
+        """
+        return self.intersection_count
+
+    def is_line_end(self) -> bool:
+        """
+        :return: If the line was lost while centred under the robot, as when driving off the end of it,
+            rather than drifting off to one side. Cleared once the line is seen again
+        :rtype: bool
+        """
+        return self.line_end
+
+    def _update(self):
+        """
+        Non-api method; takes the latest reflectance readings and updates the estimate
+        """
+        left = self.reflectance.get_left()
+        right = self.reflectance.get_right()
+        total = left + right
+        self.confidence = max(left, right)
+
+        if self.confidence < self.lost_threshold:
+            self._lost_times += 1
+            if self._lost_times >= self.detection_count and not self.line_lost:
+                self.line_lost = True
+                # Running off the end leaves the line centred as it disappears, overshooting leaves it to one side
+                self.line_end = self._tracking and abs(self._last_seen_position) < 0.5
+            # Steer back towards the side the line was last seen on
+            self.position = float(self.last_side)
+            self.intersection = False
+            self._intersection_times = 0
+            return
+
+        self._lost_times = 0
+        self.line_lost = False
+        self.line_end = False
+        self._tracking = True
+
+        # Interpolate between the sensors; each one pulls the position towards its own side by how much line it sees
+        position = (left - right) / total
+        self.position = position
+        self._last_seen_position = position
+        if position > 0.1:
+            self.last_side = 1
+        elif position < -0.1:
+            self.last_side = -1
+
+        if left > self.intersection_threshold and right > self.intersection_threshold:
+            self._intersection_times += 1
+            if self._intersection_times == self.detection_count:
+                self.intersection = True
+                self.intersection_count += 1
+        else:
+            self._intersection_times = 0
+            self.intersection = False
@@ -1,4 +1,49 @@
 from machine import Pin, PWM
+from array import array
+
+def _build_effort_lut(deadband: float, speed_curve: list, size: int):
+    """
+    Non-api function; precomputes the table that maps a requested effort to the effort actually sent to the motor.
+    Entry i is the output for a requested effort of i / (size - 1). Entry 0 is the output just above zero effort,
+    since zero effort itself always gives zero output
+    """
+    lut = array('f', [0] * size)
+    if speed_curve is None:
+        # Skip straight past the deadband, then scale linearly up to full effort
+        for i in range(size):
+            lut[i] = deadband + (1 - deadband) * i / (size - 1)
+        return lut
+
+    # Invert the measured curve: for each fraction of top speed, find the effort that gives it
+    top_speed = speed_curve[-1]
+    steps = len(speed_curve) - 1
+    # The deadband is the last measured effort at which the wheel still didn't move
+    segment = 0
+    while segment < steps - 1 and speed_curve[segment + 1] <= speed_curve[0]:
+        segment += 1
+    lut[0] = segment / steps
+    for i in range(1, size):
+        target = top_speed * i / (size - 1)
+        while segment < steps - 1 and speed_curve[segment + 1] < target:
+            segment += 1
+        low = speed_curve[segment]
+        high = speed_curve[segment + 1]
+        fraction = (target - low) / (high - low) if high > low else 1
+        fraction = max(0, min(1, fraction))
+        lut[i] = (segment + fraction) / steps
+    return lut
+
+def _apply_effort_lut(lut, effort: float) -> float:
+    """
+    Non-api function; looks up a non-negative effort in a table from _build_effort_lut, interpolating between entries
+    """
+    if effort <= 0:
+        return 0.0
+    position = min(effort, 1) * (len(lut) - 1)
+    index = int(position)
+    if index >= len(lut) - 1:
+        return lut[-1]
+    return lut[index] + (lut[index + 1] - lut[index]) * (position - index)
 
 class SinglePWMMotor:
 
@@ -8,13 +53,51 @@ class SinglePWMMotor:
     This version is used for the XRP Beta, which uses the rp2040 processor
     """
 
-    def __init__(self, in1_direction_pin: int|str, in2_speed_pin: int|str, flip_dir:bool=False):
+    def __init__(self, in1_direction_pin: int|str, in2_speed_pin: int|str, flip_dir:bool=False, pwm_frequency: int = 50):
         self.flip_dir = flip_dir
         self._MAX_PWM = 65534 # Motor holds when actually at full power
 
         self._in1DirPin = Pin(in1_direction_pin, Pin.OUT)
         self._in2SpeedPin = PWM(Pin(in2_speed_pin, Pin.OUT))
-        self._in2SpeedPin.freq(50)
+        self._pwm_pins = [self._in2SpeedPin]
+        self.set_pwm_frequency(pwm_frequency)
+        self._effort_lut = None
+        # The last values written, so unchanged values aren't written again. -1 forces the next write
+        self._duty = -1
+        self._direction = -1
+
+    def set_pwm_frequency(self, frequency: int):
+        """
+        Sets the PWM frequency of the motor driver. The default of 50 Hz is audible and gives lumpy torque at low effort;
+        frequencies of 10-20 kHz are silent and smoother. Note that pins sharing a PWM slice share a frequency
+
+        :param frequency: The PWM frequency, in Hz
+        :type frequency: int
+        """
+        self.pwm_frequency = frequency
+        for pin in self._pwm_pins:
+            pin.freq(frequency)
+
+    def set_linearization(self, deadband: float = 0.0, speed_curve: list = None, size: int = 33):
+        """
+        Reshapes efforts before they reach the motor, so that effort maps linearly to wheel speed.
+        The mapping is precomputed into a table, so applying it costs one lookup per set_effort()
+
+        :param deadband: The smallest effort that makes the motor turn. Any non-zero effort starts from here. Ignored if a speed_curve is given
+        :type deadband: float
+        :param speed_curve: Measured wheel speeds, in any units, at evenly spaced efforts from 0 to 1 inclusive. Must be increasing.
+            The deadband is taken from the curve itself
+        :type speed_curve: list<float>
+        :param size: The number of entries in the precomputed table
+        :type size: int
+        """
+        self._effort_lut = _build_effort_lut(deadband, speed_curve, size)
+
+    def clear_linearization(self):
+        """
+        Stops reshaping efforts, so they go straight to the motor
+        """
+        self._effort_lut = None
 
     def set_effort(self, effort: float):
         """
@@ -32,17 +115,27 @@ class SinglePWMMotor:
             self._set_direction(0)
         # Cap power to [0,1]
         effort = max(0,min(effort,1))
-        self._in2SpeedPin.duty_u16(int(effort*self._MAX_PWM))
+        if self._effort_lut is not None:
+            effort = _apply_effort_lut(self._effort_lut, effort)
+        self._set_duty(int(effort*self._MAX_PWM))
 
     def _set_direction(self, direction: int):
+        if direction == self._direction:
+            return
+        self._direction = direction
         if self.flip_dir:
             self._in1DirPin.value(not direction)
         else:
             self._in1DirPin.value(direction)
 
+    def _set_duty(self, duty: int):
+        if duty != self._duty:
+            self._duty = duty
+            self._in2SpeedPin.duty_u16(duty)
+
     def brake(self):
         # Motor holds with the real max duty cycle (65535)
-        self._in2SpeedPin.duty_u16(self._MAX_PWM+1)
+        self._set_duty(self._MAX_PWM+1)
 
     def coast(self):
         self.set_effort(0)
@@ -54,14 +147,51 @@ class DualPWMMotor:
     This version of the Motor class is used for the official release of the XRP
     """
 
-    def __init__(self, in1_pwm_forward: int|str, in2_pwm_backward: int|str, flip_dir:bool=False):
+    def __init__(self, in1_pwm_forward: int|str, in2_pwm_backward: int|str, flip_dir:bool=False, pwm_frequency: int = 50):
         self.flip_dir = flip_dir
         self._MAX_PWM = 65535 # Motor holds when actually at full power
 
         self._in1ForwardPin = PWM(Pin(in1_pwm_forward, Pin.OUT))
         self._in2BackwardPin = PWM(Pin(in2_pwm_backward, Pin.OUT))
-        self._in1ForwardPin.freq(50)
-        self._in2BackwardPin.freq(50)
+        self._pwm_pins = [self._in1ForwardPin, self._in2BackwardPin]
+        self.set_pwm_frequency(pwm_frequency)
+        self._effort_lut = None
+        # The last duties written, so unchanged channels aren't written again. -1 forces the next write
+        self._forward_duty = -1
+        self._backward_duty = -1
+
+    def set_pwm_frequency(self, frequency: int):
+        """
+        Sets the PWM frequency of the motor driver. The default of 50 Hz is audible and gives lumpy torque at low effort;
+        frequencies of 10-20 kHz are silent and smoother. Note that pins sharing a PWM slice share a frequency
+
+        :param frequency: The PWM frequency, in Hz
+        :type frequency: int
+        """
+        self.pwm_frequency = frequency
+        for pin in self._pwm_pins:
+            pin.freq(frequency)
+
+    def set_linearization(self, deadband: float = 0.0, speed_curve: list = None, size: int = 33):
+        """
+        Reshapes efforts before they reach the motor, so that effort maps linearly to wheel speed.
+        The mapping is precomputed into a table, so applying it costs one lookup per set_effort()
+
+        :param deadband: The smallest effort that makes the motor turn. Any non-zero effort starts from here. Ignored if a speed_curve is given
+        :type deadband: float
+        :param speed_curve: Measured wheel speeds, in any units, at evenly spaced efforts from 0 to 1 inclusive. Must be increasing.
+            The deadband is taken from the curve itself
+        :type speed_curve: list<float>
+        :param size: The number of entries in the precomputed table
+        :type size: int
+        """
+        self._effort_lut = _build_effort_lut(deadband, speed_curve, size)
+
+    def clear_linearization(self):
+        """
+        Stops reshaping efforts, so they go straight to the motor
+        """
+        self._effort_lut = None
 
     def set_effort(self, effort: float):
         """
@@ -72,25 +202,33 @@ class DualPWMMotor:
         """
 
         in1Pwm = (effort < 0) ^ (self.flip_dir)
+        effort = abs(effort)
+        if self._effort_lut is not None:
+            effort = _apply_effort_lut(self._effort_lut, effort)
         if in1Pwm:
-            self._in1ForwardPin.duty_u16(int(abs(effort)*self._MAX_PWM))
-            self._in2BackwardPin.duty_u16(int(0))
+            self._set_duties(int(effort*self._MAX_PWM), 0)
         else:
-            self._in1ForwardPin.duty_u16(int(0))
-            self._in2BackwardPin.duty_u16(int(abs(effort)*self._MAX_PWM))
+            self._set_duties(0, int(effort*self._MAX_PWM))
+
+    def _set_duties(self, forward_duty: int, backward_duty: int):
+        # Only write the channels that changed; most updates only change one
+        if forward_duty != self._forward_duty:
+            self._forward_duty = forward_duty
+            self._in1ForwardPin.duty_u16(forward_duty)
+        if backward_duty != self._backward_duty:
+            self._backward_duty = backward_duty
+            self._in2BackwardPin.duty_u16(backward_duty)
 
     def brake(self):
         """
         Powers the motor in both directions at the same time, enabling it to hold position
         """
-        self._in1ForwardPin.duty_u16(int(self._MAX_PWM))
-        self._in2BackwardPin.duty_u16(int(self._MAX_PWM))
+        self._set_duties(int(self._MAX_PWM), int(self._MAX_PWM))
 
     def coast(self):
         """
         Disables the motor in both directions at the same time, enabling it to spin freely
         """
-        self._in1ForwardPin.duty_u16(int(0))
-        self._in2BackwardPin.duty_u16(int(0))
+        self._set_duties(0, 0)
         
                 
@@ -1,15 +1,51 @@
 from .encoded_motor import EncodedMotor
+from .encoder import Encoder
+from .controller_bank import PIDBank
+from .pid import PID
+from array import array
 class MotorGroup(EncodedMotor):
     def __init__(self, *motors: EncodedMotor):
         """
         A wrapper class for multiple motors, allowing them to be treated as one motor.
+        Speed control for the group runs every motor's loop from one PIDBank, in the shared motor update tick.
         
         :param motors: The motors to add to this group
         :type motors: tuple<EncodedMotor>
         """
         self.motors = []
+        self.target_speed = None
+        # Gains for each motor's speed loop; matches the EncodedMotor default speed controller
+        self._speed_gains = (0.035, 0.03, 0)
+        self._speed_max_integral = 50
+        self._speed_output_range = (0, 1)
+        self.speed_bank = None
+        # False once a non-PID speed controller is set, which the motors then run themselves
+        self._bank_speed_control = True
+        # Cross-coupled synchronization, off until set_synchronization() is called
+        self.synchronized = False
+        self.sync_position_gain = 0.1
+        self.sync_speed_gain = 0.2
+        self.sync_effort_gain = 0.035
+        self._sync_effort = None
+        self._sync_state = (array('i'), array('f'))
         for motor in motors:
             self.add_motor(motor)
+        EncodedMotor._register_update(self)
+
+    def _rebuild_speed_bank(self):
+        """
+        Non-api method; resizes the speed controller bank to match the motors in this group
+        """
+        if not self._bank_speed_control:
+            return
+        kp, ki, kd = self._speed_gains
+        min_output, max_output = self._speed_output_range
+        count = len(self.motors)
+        bank = PIDBank(count, kp, ki, kd, min_output=min_output, max_output=max_output, max_integral=self._speed_max_integral,
+                       timestep=EncodedMotor._UPDATE_PERIOD_MS / 1000)
+        # Swapped in as one tuple, so the update tick never sees a bank and buffers of different sizes
+        self._speed_loop = (bank, array('f', [0] * count), array('f', [0] * count))
+        self.speed_bank = bank
 
     def add_motor(self, motor:EncodedMotor):
         """
@@ -17,6 +53,8 @@ class MotorGroup(EncodedMotor):
         :type motor: EncodedMotor
         """
         self.motors.append(motor)
+        self._rebuild_speed_bank()
+        self._reset_sync()
 
     def remove_motor(self, motor:EncodedMotor):
         """
@@ -25,6 +63,8 @@ class MotorGroup(EncodedMotor):
         """
         try:
             self.motors.remove(motor)
+            self._rebuild_speed_bank()
+            self._reset_sync()
         except:
             print("Failed to remove motor from Motor Group")
 
@@ -33,9 +73,149 @@ class MotorGroup(EncodedMotor):
         :param effort: The effort to set all motors in this group to, from -1 to 1
         :type effort: float
         """
+        if self.synchronized and effort != 0:
+            # The group sets each motor's effort itself, nudging them back into step every update
+            if self._sync_effort is None:
+                # Only turn off the motors' own speed control on the way in. Nothing is written here,
+                # so calling this every loop doesn't knock the motors back to zero between updates
+                for motor in self.motors:
+                    motor.target_speed = None
+                if self.target_speed is None:
+                    self._reset_sync()
+            self.target_speed = None
+            self._sync_effort = effort
+            return
+        self._sync_effort = None
         for motor in self.motors:
             motor.set_effort(effort)
-        
+
+    def set_synchronization(self, synchronized: bool = True, position_gain: float = 0.1, speed_gain: float = 0.2, effort_gain: float = 0.035):
+        """
+        Keeps the motors of the group in lockstep, for motors that drive a shared mechanism and would otherwise fight each other.
+        Every update, each motor is slowed by how far it has got ahead of the slowest motor, and by how much faster it is
+        turning, so the group moves at the pace of its slowest motor instead of binding. Works with set_speed() using the
+        default PID speed control, and with set_effort().
+
+        :param synchronized: True to keep the motors in step, False to let them run independently
+        :type synchronized: bool
+        :param position_gain: How much speed to take off a motor for each encoder count it is ahead, in counts per update
+        :type position_gain: float
+        :param speed_gain: How much speed to take off a motor for each count per update it is faster than the slowest
+        :type speed_gain: float
+        :param effort_gain: Converts the speed adjustment into an effort adjustment when running from set_effort()
+        :type effort_gain: float
+        """
+        self.sync_position_gain = position_gain
+        self.sync_speed_gain = speed_gain
+        self.sync_effort_gain = effort_gain
+        if synchronized and not self.synchronized:
+            self._reset_sync()
+        if not synchronized and self._sync_effort is not None:
+            # Hand the effort back to the motors themselves
+            effort = self._sync_effort
+            self._sync_effort = None
+            for motor in self.motors:
+                motor.set_effort(effort)
+        self.synchronized = synchronized
+
+    def _reset_sync(self):
+        """
+        Non-api method; makes the current positions of the motors the point they are kept in step from
+        """
+        count = len(self.motors)
+        origins = array('i', [0] * count)
+        for i in range(count):
+            origins[i] = self.motors[i].get_position_counts()
+        # Swapped in as one tuple, so the update tick never sees buffers of different sizes
+        self._sync_state = (origins, array('f', [0] * count))
+
+    def _update_coupling(self, count: int, direction: int) -> int:
+        """
+        Non-api method; works out how much each motor should be held back to stay in step with the slowest one
+
+        :return: The number of motors worked out, which may be fewer than count while the group is changing
+        :rtype: int
+        """
+        motors = self.motors
+        origins, couplings = self._sync_state
+        count = min(count, len(origins))
+        min_progress = 0
+        min_speed = 0
+        # Compare along the direction of travel, so "slowest" means the same thing going backwards
+        for i in range(count):
+            progress = direction * (motors[i].prev_position - origins[i])
+            speed = direction * motors[i].speed
+            couplings[i] = progress
+            if i == 0 or progress < min_progress:
+                min_progress = progress
+            if i == 0 or speed < min_speed:
+                min_speed = speed
+        for i in range(count):
+            couplings[i] = direction * (self.sync_position_gain * (couplings[i] - min_progress)
+                                        + self.sync_speed_gain * (direction * motors[i].speed - min_speed))
+        return count
+
+    def set_voltage_compensation(self, nominal_voltage: float = 5.0, board = None):
+        """
+        Turns on battery voltage compensation for every motor in this group. The group sets its efforts through
+        its motors, so each motor compensates its own output. See EncodedMotor.set_voltage_compensation()
+
+        :param nominal_voltage: The battery voltage that an effort of 1 corresponds to, in volts. None turns compensation off
+        :type nominal_voltage: float
+        :param board: The board to read the battery voltage from. Defaults to the default board
+        :type board: Board
+        """
+        for motor in self.motors:
+            motor.set_voltage_compensation(nominal_voltage, board)
+
+    def set_output_limits(self, slew_rate: float = None, current_limit: float = None, free_speed: float = 100, stall_current: float = 1.6):
+        """
+        Sets the same output limits on every motor in this group. The group has no output stage of its own;
+        its efforts go through each motor's, so the limits apply per motor. See EncodedMotor.set_output_limits()
+
+        :param slew_rate: The most the output may change by in one second, in effort per second. None for no slew limit
+        :type slew_rate: float
+        :param current_limit: The most current each motor may draw, in amps. None for no current limit
+        :type current_limit: float
+        :param free_speed: The motors' speed with no load at full effort, in rpm
+        :type free_speed: float
+        :param stall_current: The current each motor draws when stalled at full effort, in amps
+        :type stall_current: float
+        """
+        for motor in self.motors:
+            motor.set_output_limits(slew_rate, current_limit, free_speed, stall_current)
+
+    def set_pwm_frequency(self, frequency: int):
+        """
+        Sets the PWM frequency of every motor in this group. See EncodedMotor.set_pwm_frequency()
+
+        :param frequency: The PWM frequency, in Hz
+        :type frequency: int
+        """
+        for motor in self.motors:
+            motor.set_pwm_frequency(frequency)
+
+    def set_linearization(self, deadband: float = 0.0, speed_curve: list = None, size: int = 33):
+        """
+        Sets the same linearization on every motor in this group. See EncodedMotor.set_linearization()
+
+        :param deadband: The smallest effort that makes the motors turn. Ignored if a speed_curve is given
+        :type deadband: float
+        :param speed_curve: Measured wheel speeds at evenly spaced efforts from 0 to 1 inclusive. Must be increasing
+        :type speed_curve: list<float>
+        :param size: The number of entries in the precomputed table
+        :type size: int
+        """
+        for motor in self.motors:
+            motor.set_linearization(deadband, speed_curve, size)
+
+    def clear_linearization(self):
+        """
+        Stops reshaping efforts on every motor in this group
+        """
+        for motor in self.motors:
+            motor.clear_linearization()
+
     def get_position(self) -> float:
         """
         :return: The average position of all motors in this group, in revolutions, relative to the last time reset was called.
@@ -62,6 +242,7 @@ class MotorGroup(EncodedMotor):
         """
         for motor in self.motors:
             motor.reset_encoder_position()
+        self._reset_sync()
 
     def get_speed(self) -> float:
         """
@@ -82,13 +263,77 @@ class MotorGroup(EncodedMotor):
         :param target_speed_rpm: The target speed for these motors in rpm, or None
         :type target_speed_rpm: float, or None
         """
+        self._sync_effort = None
+        if not self._bank_speed_control:
+            for motor in self.motors:
+                motor.set_speed(target_speed_rpm)
+            return
+        if target_speed_rpm is None or target_speed_rpm == 0 or len(self.motors) == 0:
+            self.target_speed = None
+            # Stopping, so the motors' efforts are set to zero as well
+            for motor in self.motors:
+                motor.set_speed()
+            return
+        # Each motor's own speed control is turned off; the group runs all of them together.
+        # Nothing is written here, so calling this every loop doesn't knock the motors back to zero between updates
         for motor in self.motors:
-            motor.set_speed(target_speed_rpm)
+            motor.target_speed = None
+        # Convert from rev per min to counts per update (60 sec/min, 50 Hz)
+        target_speed = target_speed_rpm*Encoder.resolution/(60*50)
+        if self.target_speed is None or (target_speed > 0) != (self.target_speed > 0):
+            # Starting from a stop or reversing, so the old integrals no longer apply,
+            # and the motors are kept in step from here
+            self._reset_sync()
+            self.speed_bank.clear_history()
+        self.target_speed = target_speed
 
     def set_speed_controller(self, new_controller):
         """
+        Sets a new controller for speed control. A PID's gains and output limits are copied into every motor's loop,
+        so that each motor keeps its own integral and derivative state. Any other Controller, including a PID with
+        a max_derivative or a subclass of PID, can't be run that way, so it is shared by all motors.
+
         :param new_controller: The new Controller for speed control
         :type new_controller: Controller
         """
+        if type(new_controller) is PID and new_controller.max_derivative is None:
+            self._speed_gains = (new_controller.kp, new_controller.ki, new_controller.kd)
+            self._speed_max_integral = new_controller.max_integral
+            self._speed_output_range = (new_controller.min_output, new_controller.max_output)
+            self._bank_speed_control = True
+            self._rebuild_speed_bank()
+            return
+        self.target_speed = None
+        self._bank_speed_control = False
         for motor in self.motors:
-            motor.set_speed_controller(new_controller)
\ No newline at end of file
+            motor.set_speed_controller(new_controller)
+
+    def _update(self):
+        """
+        Non-api method; runs speed control and synchronization for every motor in the group at once.
+        Called from the shared update tick after the motors have updated their speeds.
+        """
+        motors = self.motors
+        if self._sync_effort is not None:
+            effort = self._sync_effort
+            count = self._update_coupling(len(motors), 1 if effort >= 0 else -1)
+            couplings = self._sync_state[1]
+            for i in range(count):
+                motors[i]._write_effort(max(-1, min(1, effort - self.sync_effort_gain * couplings[i])))
+            return
+        if self.target_speed is None:
+            return
+        bank, errors, efforts = self._speed_loop
+        # Guards against the motor list changing while the bank is being resized
+        count = min(len(motors), bank.size)
+        if self.synchronized:
+            count = self._update_coupling(count, 1 if self.target_speed >= 0 else -1)
+            couplings = self._sync_state[1]
+            for i in range(count):
+                errors[i] = self.target_speed - motors[i].speed - couplings[i]
+        else:
+            for i in range(count):
+                errors[i] = self.target_speed - motors[i].speed
+        bank.update(errors, efforts)
+        for i in range(count):
+            motors[i]._write_effort(efforts[i])
\ No newline at end of file
@@ -16,7 +16,8 @@ class PID(Controller):
                  max_derivative = None,
                  max_integral = None,
                  tolerance = 0.1,
-                 tolerance_count = 1
+                 tolerance_count = 1,
+                 timestep = None
                  ):
         """
         :param kp: proportional gain
@@ -28,10 +29,15 @@ class PID(Controller):
         :param max_integral: maximum integral windup allowed (will cap integral at this value)
         :param tolerance: tolerance for exit condition
         :param tolerance_count: number of times the error needs to be within tolerance for is_done to return True
+        :param timestep: fixed time between updates, in seconds. Use when the loop runs at a known rate, such as from a timer,
+            to skip measuring the time on every update. None measures the time between updates
         """
+        self._kd = kd
+        self._timestep = timestep
         self.kp = kp
         self.ki = ki
         self.kd = kd
+        self.timestep = timestep
         self.min_output = min_output
         self.max_output = max_output
         self.max_derivative = max_derivative
@@ -49,6 +55,32 @@ class PID(Controller):
         # number of actual times in tolerance
         self.times = 0
 
+    @property
+    def kd(self) -> float:
+        return self._kd
+
+    @kd.setter
+    def kd(self, kd: float):
+        self._kd = kd
+        self._update_fixed_gains()
+
+    @property
+    def timestep(self) -> float:
+        """
+        The fixed time between updates in seconds, or None if it is measured on every update
+        """
+        return self._timestep
+
+    @timestep.setter
+    def timestep(self, timestep: float):
+        self._timestep = timestep
+        self._update_fixed_gains()
+
+    def _update_fixed_gains(self):
+        # Precompute the derivative gain for the fixed timestep, so each update skips the divide
+        if self._timestep is not None:
+            self._kd_over_timestep = self._kd / self._timestep
+
     def _handle_exit_condition(self, error: float):
         if abs(error) < self.tolerance:
             # if error is within tolerance, increment times in tolerance
@@ -57,25 +89,35 @@ class PID(Controller):
             # otherwise, reset times in tolerance, because we need to be in tolerance for numTimesInTolerance consecutive times
             self.times = 0
 
-    def update(self, error: float, debug: bool = False) -> float:
+    def update(self, error: float, debug: bool = False, error_rate: float = None, dt: float = None) -> float:
         """
         Handle a new update of this PID loop given an error.
 
         :param error: The error of the system being controlled by this PID controller
         :type error: float
+        :param error_rate: The measured rate of change of the error (per second), if available. When given, it is used
+            for the derivative term instead of differencing the error, which is noisier and a full update late
+        :type error_rate: float
+        :param dt: The time since the last update in seconds, if the caller already knows it. Overrides the fixed timestep
+        :type dt: float
 
         :return: The system output from the controller, to be used as an effort value or for any other purpose
         :rtype: float
         """
-        current_time = time.ticks_ms()
-        if self.prev_time is None:
-            # First update after instantiation
-            self.start_time = current_time
-            timestep = 0.01
+        if dt is not None:
+            timestep = dt
+        elif self._timestep is not None:
+            timestep = self._timestep
         else:
-            # get time delta in seconds
-            timestep = time.ticks_diff(current_time, self.prev_time) / 1000
-        self.prev_time = current_time # cache time for next update
+            current_time = time.ticks_ms()
+            if self.prev_time is None:
+                # First update after instantiation
+                self.start_time = current_time
+                timestep = 0.01
+            else:
+                # get time delta in seconds
+                timestep = time.ticks_diff(current_time, self.prev_time) / 1000
+            self.prev_time = current_time # cache time for next update
 
         self._handle_exit_condition(error)
 
@@ -84,10 +126,16 @@ class PID(Controller):
         if self.max_integral is not None:
             integral = max(-self.max_integral, min(self.max_integral, integral))
 
-        derivative = (error - self.prev_error) / timestep
+        if error_rate is not None:
+            derivative_term = self._kd * error_rate
+        elif dt is None and self._timestep is not None:
+            # Fixed timestep; the derivative gain already has the timestep divided in
+            derivative_term = (error - self.prev_error) * self._kd_over_timestep
+        else:
+            derivative_term = self._kd * (error - self.prev_error) / timestep
 
         # derive output
-        output = self.kp * error + self.ki * integral + self.kd * derivative
+        output = self.kp * error + self.ki * integral + derivative_term
         self.prev_error = error
         self.prev_integral = integral
 
@@ -110,7 +158,7 @@ class PID(Controller):
         self.prev_output = output
 
         if debug:
-            print(f"{output}: ({self.kp * error}, {self.ki * integral}, {self.kd * derivative})")
+            print(f"{output}: ({self.kp * error}, {self.ki * integral}, {derivative_term})")
 
         return output
     
@@ -126,4 +174,236 @@ class PID(Controller):
         self.prev_integral = 0
         self.prev_output = 0
         self.prev_time = None
-        self.times = 0
\ No newline at end of file
+        self.times = 0
+
+class AdvancedPID(PID):
+
+    def __init__(self,
+                 kp = 1.0,
+                 ki = 0.0,
+                 kd = 0.0,
+                 min_output = 0.0,
+                 max_output = 1.0,
+                 max_derivative = None,
+                 max_integral = None,
+                 tolerance = 0.1,
+                 tolerance_count = 1,
+                 timestep = None,
+                 derivative_filter = 0.02,
+                 anti_windup_gain = None,
+                 deadband = None,
+                 offset_min_output = True
+                 ):
+        """
+        A drop-in replacement for PID that settles more smoothly:
+
+        - The derivative term is low pass filtered, so it doesn't amplify sensor noise
+        - The derivative can be taken on the measurement instead of the error, so setpoint changes don't kick the output
+        - The integral unwinds by back-calculation while the output is saturated, instead of only being capped
+        - min_output is added as an offset (to overcome friction) instead of being a floor, and is not applied
+          inside the deadband, so the output doesn't chatter around zero. This can be turned off to keep PID's floor
+
+        :param kp: proportional gain
+        :param ki: integral gain
+        :param kd: derivative gain
+        :param min_output: output offset needed to get the system moving; applied outside of the deadband
+        :param max_output: maximum output
+        :param max_derivative: maximum derivative (change per second)
+        :param max_integral: maximum integral windup allowed (will cap integral at this value)
+        :param tolerance: tolerance for exit condition
+        :param tolerance_count: number of times the error needs to be within tolerance for is_done to return True
+        :param timestep: fixed time between updates, in seconds. None measures the time between updates
+        :param derivative_filter: time constant of the derivative low pass filter, in seconds. 0 disables filtering
+        :param anti_windup_gain: how quickly the integral unwinds while the output is saturated, per second. Defaults to ki / kp
+        :param deadband: error below which min_output is not applied. Defaults to the tolerance
+        :param offset_min_output: True to add min_output as an offset outside the deadband, False to use it as a floor like PID does
+        """
+        super().__init__(kp, ki, kd, min_output, max_output, max_derivative, max_integral, tolerance, tolerance_count, timestep)
+        self.derivative_filter = derivative_filter
+        self.anti_windup_gain = anti_windup_gain
+        self.deadband = tolerance if deadband is None else deadband
+        self.offset_min_output = offset_min_output
+
+        self.integral_term = 0
+        self.prev_derivative = 0
+        self.prev_measurement = None
+        self.first_update = True
+
+    def update(self, error: float, debug: bool = False, error_rate: float = None, measurement: float = None, dt: float = None) -> float:
+        """
+        Handle a new update of this PID loop given an error.
+
+        :param error: The error of the system being controlled by this PID controller
+        :type error: float
+        :param error_rate: The measured rate of change of the error (per second), if available. Used for the derivative term without filtering
+        :type error_rate: float
+        :param measurement: The measured value of the system, if available. When given, the derivative is taken on this instead of the error
+        :type measurement: float
+        :param dt: The time since the last update in seconds, if the caller already knows it. Overrides the fixed timestep
+        :type dt: float
+
+        :return: The system output from the controller, to be used as an effort value or for any other purpose
+        :rtype: float
+        """
+        first_update = self.first_update
+        self.first_update = False
+        if dt is not None:
+            timestep = dt
+        elif self._timestep is not None:
+            timestep = self._timestep
+        else:
+            current_time = time.ticks_ms()
+            if first_update:
+                # First update after instantiation
+                self.start_time = current_time
+                timestep = 0.01
+            else:
+                # get time delta in seconds
+                timestep = time.ticks_diff(current_time, self.prev_time) / 1000
+                if timestep <= 0:
+                    timestep = 0.001
+            self.prev_time = current_time # cache time for next update
+
+        self._handle_exit_condition(error)
+
+        if error_rate is not None:
+            derivative = error_rate
+        else:
+            if measurement is not None:
+                # The error changes opposite to the measurement when the setpoint is held, and not at all when only the setpoint moves
+                raw_derivative = 0 if self.prev_measurement is None else -(measurement - self.prev_measurement) / timestep
+                self.prev_measurement = measurement
+            else:
+                raw_derivative = 0 if first_update else (error - self.prev_error) / timestep
+            # First order low pass filter
+            alpha = timestep / (self.derivative_filter + timestep)
+            derivative = self.prev_derivative + alpha * (raw_derivative - self.prev_derivative)
+        self.prev_derivative = derivative
+
+        self.integral_term += self.ki * error * timestep
+        if self.max_integral is not None:
+            limit = abs(self.ki) * self.max_integral
+            self.integral_term = max(-limit, min(limit, self.integral_term))
+
+        # derive output, before the min_output offset is added
+        output = self.kp * error + self.integral_term + self.kd * derivative
+        self.prev_error = error
+
+        # min_output can never take the output past max_output
+        min_output = min(self.min_output, self.max_output)
+        if self.offset_min_output:
+            # min_output is added on top, so the rest of the output can only span what's left
+            output_range = self.max_output - min_output
+        else:
+            output_range = self.max_output
+        saturated = max(-output_range, min(output_range, output))
+
+        # Back-calculation: bleed off the integral by however much the output is being clipped
+        anti_windup_gain = self.anti_windup_gain
+        if anti_windup_gain is None:
+            anti_windup_gain = self.ki / self.kp if self.kp != 0 else 0
+        self.integral_term += anti_windup_gain * (saturated - output) * timestep
+
+        if self.offset_min_output:
+            # Offset by minimum, outside of the deadband. If nothing is left for the rest of the output, push towards the error
+            if abs(error) > self.deadband:
+                if saturated > 0 or (saturated == 0 and error > 0):
+                    saturated += min_output
+                else:
+                    saturated -= min_output
+        elif saturated > 0:
+            # Bound output by minimum, as PID does
+            saturated = max(min_output, saturated)
+        else:
+            saturated = min(-min_output, saturated)
+        output = saturated
+
+        # Bound output by maximum acceleration
+        if self.max_derivative is not None:
+            lower_bound = self.prev_output - self.max_derivative * timestep
+            upper_bound = self.prev_output + self.max_derivative * timestep
+            output = max(lower_bound, min(upper_bound, output))
+
+        # cache output for next update
+        self.prev_output = output
+
+        if debug:
+            print(f"{output}: ({self.kp * error}, {self.integral_term}, {self.kd * derivative})")
+
+        return output
+
+    def clear_history(self):
+        super().clear_history()
+        self.integral_term = 0
+        self.prev_derivative = 0
+        self.prev_measurement = None
+        self.first_update = True
+
+
+class GainScheduledPID(AdvancedPID):
+
+    def __init__(self,
+                 gain_table,
+                 schedule_source = None,
+                 **kwargs
+                 ):
+        """
+        An AdvancedPID whose kp, ki and kd are interpolated from a small table, by operating point.
+        Use it where one set of gains can't cover the whole operating range, such as turning at different efforts.
+
+        :param gain_table: Rows of (operating_point, kp, ki, kd), in increasing order of operating_point.
+            Operating points outside the table use the gains of the nearest end
+        :param schedule_source: An optional function returning the current operating point, called on every update.
+            Without one, set_operating_point() must be called whenever the operating point changes
+        :param kwargs: Any other parameters for the AdvancedPID, such as max_output or tolerance
+        """
+        self._points = [row[0] for row in gain_table]
+        self._gains = [(row[1], row[2], row[3]) for row in gain_table]
+        # Precompute the slope of each gain between rows, so interpolating is one multiply per gain
+        self._slopes = []
+        for i in range(len(gain_table) - 1):
+            width = self._points[i + 1] - self._points[i]
+            self._slopes.append(tuple((self._gains[i + 1][j] - self._gains[i][j]) / width for j in range(3)))
+        self.schedule_source = schedule_source
+
+        kp, ki, kd = self._gains[0]
+        super().__init__(kp, ki, kd, **kwargs)
+
+    def set_operating_point(self, operating_point: float):
+        """
+        Sets the gains for the given operating point
+
+        :param operating_point: The current operating point, in the same units as the gain table
+        :type operating_point: float
+        """
+        points = self._points
+        if operating_point <= points[0]:
+            self.kp, self.ki, self.kd = self._gains[0]
+            return
+        last = len(points) - 1
+        if operating_point >= points[last]:
+            self.kp, self.ki, self.kd = self._gains[last]
+            return
+        i = 0
+        while operating_point > points[i + 1]:
+            i += 1
+        offset = operating_point - points[i]
+        kp, ki, kd = self._gains[i]
+        kp_slope, ki_slope, kd_slope = self._slopes[i]
+        self.kp = kp + kp_slope * offset
+        self.ki = ki + ki_slope * offset
+        self.kd = kd + kd_slope * offset
+
+    def update(self, error: float, debug: bool = False, error_rate: float = None, measurement: float = None, dt: float = None) -> float:
+        """
+        Handle a new update of this PID loop given an error, first rescheduling the gains if there is a schedule source.
+
+        :param error: The error of the system being controlled by this PID controller
+        :type error: float
+
+        :return: The system output from the controller, to be used as an effort value or for any other purpose
+        :rtype: float
+        """
+        if self.schedule_source is not None:
+            self.set_operating_point(self.schedule_source())
+        return super().update(error, debug, error_rate, measurement, dt)
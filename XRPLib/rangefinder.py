@@ -1,8 +1,19 @@
-import machine, time
-from machine import Pin
+import machine, time, math
+from machine import Pin, Timer
+from array import array
 
 class Rangefinder:
 
+    # Results of the most recent measurement, from get_status()
+    STATUS_OK = 0
+    STATUS_BEYOND_GATE = 1
+    STATUS_NO_ECHO = 2
+
+    # The longest the HC-SR04 holds ECHO high, when nothing is in range. It ignores triggers until then
+    _MAX_ECHO_US = 40000
+    # Allowance for the time between the trigger and the echo starting, on top of the echo time itself
+    _START_LATENCY_US = 1000
+
     _DEFAULT_RANGEFINDER_INSTANCE = None
 
     @classmethod
@@ -28,6 +39,11 @@ class Rangefinder:
         :type timeout_us: int
         """
         self.timeout_us = timeout_us
+        self._default_timeout_us = timeout_us
+        # Maximum distance of interest in cm, or None when not range gated
+        self.max_range = None
+        self.ping_period_ms = 60
+        self._status = self.STATUS_OK
         # Init trigger pin (out)
         self._trigger = Pin(trigger_pin, mode=Pin.OUT, pull=None)
         self._trigger.value(0)
@@ -40,11 +56,38 @@ class Rangefinder:
         self.last_echo_time = 0
         self.cache_time_us = 3000
 
+        # Background ranging state. Echo edges are timestamped by a pin interrupt, so nothing ever waits on the sensor
+        self._ranging = False
+        self._ranging_timer = Timer(-1)
+        self._own_timer = False
+        self._echo_rise_time = 0
+        self._echo_high = False
+        self._echo_seen = False
+        self._pulse_us = 0
+
+        # Ring buffer of recent echo pulse times, for filtering. 0 marks a ping with no echo
+        self._samples = array('i', [0] * 5)
+        self._sample_index = 0
+        self._last_sample_time = 0
+        self.outlier_threshold = 3
+
+        # Echo time to distance conversion, which depends on the speed of sound and so on the air temperature
+        self._temperature_source = None
+        self._temperature_timer = Timer(-1)
+        self.set_temperature(20)
+
     def _send_pulse_and_wait(self):
         """
         Send the pulse to trigger and listen on echo pin.
         We use the method `machine.time_pulse_us()` to get the microseconds until the echo is received.
         """
+        if self.echo.value():
+            # Still busy with the echo of an earlier ping, which would ignore the trigger,
+            # and a gated timeout could end up timing the tail of the old echo instead
+            start = time.ticks_us()
+            while self.echo.value():
+                if time.ticks_diff(time.ticks_us(), start) > self._MAX_ECHO_US:
+                    return -2
         self._trigger.value(0) # Stabilize the sensor
         self._delay_us(5)
         self._trigger.value(1)
@@ -52,37 +95,264 @@ class Rangefinder:
         self._delay_us(10)
         self._trigger.value(0)
         try:
-            pulse_time = machine.time_pulse_us(self.echo, 1, self.timeout_us)
+            # time_pulse_us() also waits this long for the echo to start, so a small gate still needs time for the sensor to answer
+            pulse_time = machine.time_pulse_us(self.echo, 1, self.timeout_us + self._START_LATENCY_US)
             return pulse_time
         except OSError as exception:
             raise exception
 
     def distance(self) -> float:
         """
-        Get the distance in centimeters by measuring the echo pulse time
+        Get the distance in centimeters by measuring the echo pulse time.
+        While background ranging is running, this returns the latest measurement immediately instead.
         """
+        if self._ranging:
+            pulse_time = self._pulse_us
+            if pulse_time <= 0 or pulse_time > self.timeout_us:
+                return self.MAX_VALUE
+            return self._pulse_to_cm(pulse_time)
+
+        self._status = self.STATUS_OK
+
         if time.ticks_diff(time.ticks_us(), self.last_echo_time) < self.cache_time_us and not (self.cms == 65535 or self.cms == 0):
             return self.cms
 
         try:
             pulse_time = self._send_pulse_and_wait()
             if pulse_time <= 0:
+                # -1 means the echo started but was still going at the timeout, so whatever it hit is further away.
+                # Otherwise the echo never started at all
+                self._status = self.STATUS_BEYOND_GATE if pulse_time == -1 else self.STATUS_NO_ECHO
+                return self.MAX_VALUE
+            if pulse_time > self.timeout_us:
+                # Within the start allowance, but still further away than the gate
+                self._status = self.STATUS_BEYOND_GATE
                 return self.MAX_VALUE
         except OSError as exception:
             # We don't want programs to crash if the HC-SR04 doesn't see anything in range
             # So we catch those errors and return 65535 instead
             if exception.args[0] == 110: # 110 = ETIMEDOUT
+                self._status = self.STATUS_NO_ECHO
                 return self.MAX_VALUE
             raise exception
 
-        # To calculate the distance we get the pulse_time and divide it by 2
-        # (the pulse walk the distance twice) and by 29.1 becasue
-        # the sound speed on air (343.2 m/s), that It's equivalent to
-        # 0.034320 cm/us that is 1cm each 29.1us
-        self.cms = (pulse_time / 2) / 29.1
+        self.cms = self._pulse_to_cm(pulse_time)
         self.last_echo_time = time.ticks_us()
         return self.cms
 
+    def _pulse_to_cm(self, pulse_time: int) -> float:
+        # The pulse walks the distance twice, so this is half the speed of sound, in cm/us
+        return pulse_time * self._cm_per_us
+
+    def set_temperature(self, celsius: float):
+        """
+        Sets the air temperature used to work out the speed of sound. Defaults to 20 degrees C
+
+        :param celsius: The air temperature in degrees Celsius
+        :type celsius: float
+        """
+        # The speed of sound in air is 331.3 m/s at 0 degrees C, and scales with the square root of absolute temperature.
+        # Convert to cm/us and halve it, since the pulse walks the distance twice
+        speed_of_sound = 331.3 * math.sqrt(1 + celsius / 273.15)
+        self._cm_per_us = speed_of_sound * 100 / 1000000 / 2
+        if self.max_range is not None:
+            # The echo time for the gate distance depends on the speed of sound
+            self.timeout_us = int(self.max_range * 1.1 / self._cm_per_us)
+
+    def set_max_range(self, max_range: float = None, ping_period_ms: int = None):
+        """
+        Range gates the sensor: anything further than max_range is reported as beyond the gate instead of being measured.
+        The echo timeout is cut to match, so blocking reads return sooner, and the background ping rate is raised.
+        Use get_status() to tell a reading beyond the gate apart from the sensor not answering at all.
+
+        Pinging faster means echoes from objects well beyond the gate may come back during a later ping,
+        so set a slower ping_period_ms if there are large surfaces just out of range.
+        With nothing in range the sensor holds its echo for around 38 ms and ignores triggers until then,
+        so background pings that land in that time are skipped and reported as beyond the gate.
+
+        :param max_range: The furthest distance of interest in cm, or None to remove the gate
+        :type max_range: float
+        :param ping_period_ms: Time between background pings, in milliseconds. Defaults to three times the gated echo time, and at least 10 ms
+        :type ping_period_ms: int
+        """
+        self.max_range = max_range
+        if max_range is None:
+            self.timeout_us = self._default_timeout_us
+            self.ping_period_ms = 60 if ping_period_ms is None else ping_period_ms
+        else:
+            # Leave some margin so that objects right at the gate are still measured
+            self.timeout_us = int(max_range * 1.1 / self._cm_per_us)
+            if ping_period_ms is None:
+                ping_period_ms = 3 * self.timeout_us // 1000 + 1
+            # Never ping again before an echo from within the gate could have finished
+            self.ping_period_ms = max(10, self.timeout_us // 1000 + 1, ping_period_ms)
+        if self._ranging and self._own_timer:
+            self._ranging_timer.init(period=self.ping_period_ms, callback=lambda t:self._ping())
+
+    def get_status(self) -> int:
+        """
+        :return: How the most recent measurement went: STATUS_OK, STATUS_BEYOND_GATE if the echo took longer than the
+            timeout (nothing within range), or STATUS_NO_ECHO if the sensor never answered
+        :rtype: int
+        """
+        return self._status
+
+    def set_temperature_source(self, temperature_source, period_ms: int = 10000):
+        """
+        Keeps the speed of sound up to date by reading the air temperature in the background.
+        For example, pass IMU.get_default_imu().temperature to use the IMU's temperature sensor.
+
+        :param temperature_source: A function returning the air temperature in degrees Celsius, or None to stop updating
+        :type temperature_source: function
+        :param period_ms: Time between temperature readings, in milliseconds. Air temperature changes slowly, so this can be long
+        :type period_ms: int
+        """
+        self._temperature_source = temperature_source
+        self._temperature_timer.deinit()
+        if temperature_source is not None:
+            self._update_temperature()
+            self._temperature_timer.init(period=period_ms, callback=lambda t:self._update_temperature())
+
+    def _update_temperature(self):
+        """
+        Non-api method; reads the temperature source and recomputes the speed of sound
+        """
+        self.set_temperature(self._temperature_source())
+
+    def get_filtered_distance(self) -> float:
+        """
+        Get the distance in centimeters, filtered over the last few background measurements.
+        Uses a Hampel filter: the latest measurement is returned unless it is an outlier from the median of the
+        recent ones, in which case the median is returned. Pings with no echo are left out.
+        Requires background ranging to be running.
+
+        :return: The filtered distance in cm, or MAX_VALUE if there are no valid recent measurements
+        :rtype: float
+        """
+        valid = sorted(pulse for pulse in self._samples if 0 < pulse <= self.timeout_us)
+        count = len(valid)
+        if count == 0:
+            return self.MAX_VALUE
+        median = valid[count // 2] if count % 2 else (valid[count // 2 - 1] + valid[count // 2]) / 2
+
+        latest = self._samples[(self._sample_index - 1) % len(self._samples)]
+        if 0 < latest <= self.timeout_us:
+            # Median absolute deviation, scaled to match a standard deviation
+            deviations = sorted(abs(pulse - median) for pulse in valid)
+            mad = 1.4826 * deviations[count // 2]
+            if abs(latest - median) <= self.outlier_threshold * mad:
+                return self._pulse_to_cm(latest)
+        return self._pulse_to_cm(median)
+
+    def is_valid(self) -> bool:
+        """
+        :return: If at least half of the recent background measurements got an echo back, so get_filtered_distance() can be trusted
+        :rtype: bool
+        """
+        valid = 0
+        for pulse in self._samples:
+            if 0 < pulse <= self.timeout_us:
+                valid += 1
+        return valid * 2 >= len(self._samples)
+
+    def get_sample_age(self) -> float:
+        """
+        :return: The time since the most recent background measurement, in seconds
+        :rtype: float
+        """
+        return time.ticks_diff(time.ticks_us(), self._last_sample_time) / 1000000
+
+    def start_ranging(self, period_ms: int = None, filter_size: int = 5, external_trigger: bool = False):
+        """
+        Starts pinging the sensor in the background. The echo is timed by a pin interrupt, so distance() no longer
+        blocks and instead returns the latest measurement. The last few measurements are also kept for get_filtered_distance().
+
+        :param period_ms: Time between pings, in milliseconds. Defaults to 60 ms, which the HC-SR04 needs for echoes to die down,
+            or a faster rate worked out from the range gate
+        :type period_ms: int
+        :param filter_size: The number of recent measurements to filter over
+        :type filter_size: int
+        :param external_trigger: Leave the pinging to something else, such as a RangefinderManager
+        :type external_trigger: bool
+        """
+        self._pulse_us = 0
+        self._echo_high = False
+        # Nothing has been pinged yet, so the first ping has no missing echo to report
+        self._echo_seen = True
+        self._samples = array('i', [0] * filter_size)
+        self._sample_index = 0
+        self.echo.irq(handler=self._echo_irq, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, hard=True)
+        if period_ms is None:
+            period_ms = self.ping_period_ms
+        self._own_timer = not external_trigger
+        if self._own_timer:
+            self._ranging_timer.init(period=period_ms, callback=lambda t:self._ping())
+        self._ranging = True
+
+    def stop_ranging(self):
+        """
+        Stops background ranging; distance() goes back to pinging and waiting for the echo itself
+        """
+        self._ranging = False
+        self._ranging_timer.deinit()
+        self.echo.irq(handler=None)
+
+    def _ping(self):
+        """
+        Non-api method; sends one trigger pulse. Called by the ranging timer
+        """
+        state = machine.disable_irq()
+        if self.echo.value():
+            # The sensor is still busy with the last echo and would ignore a trigger, so skip this ping.
+            # That isn't a missing echo; the falling edge is still timed when it comes
+            if self._echo_high and time.ticks_diff(time.ticks_us(), self._echo_rise_time) > self.timeout_us:
+                # The echo has already run past the gate, so there was nothing within range
+                self._pulse_us = 0
+                self._status = self.STATUS_BEYOND_GATE
+                self._record_sample(0, time.ticks_us())
+            self._echo_seen = True
+            machine.enable_irq(state)
+            return
+        if not self._echo_seen:
+            # The sensor didn't answer the last ping at all
+            self._pulse_us = 0
+            self._status = self.STATUS_NO_ECHO
+            self._record_sample(0, time.ticks_us())
+        self._echo_seen = False
+        machine.enable_irq(state)
+        self._trigger.value(1)
+        # Send a 10us pulse.
+        self._delay_us(10)
+        self._trigger.value(0)
+
+    def _echo_irq(self, pin):
+        """
+        Non-api method; timestamps the edges of the echo pulse. Runs as a hard interrupt, so it must not allocate
+        """
+        now = time.ticks_us()
+        if pin.value():
+            self._echo_rise_time = now
+            self._echo_high = True
+            self._echo_seen = True
+        elif self._echo_high:
+            self._echo_high = False
+            self._pulse_us = time.ticks_diff(now, self._echo_rise_time)
+            self._status = self.STATUS_OK if self._pulse_us <= self.timeout_us else self.STATUS_BEYOND_GATE
+            self.last_echo_time = now
+            self._record_sample(self._pulse_us, now)
+
+    def _record_sample(self, pulse_time: int, now: int):
+        """
+        Non-api method; adds a measurement to the ring buffer. Called from the echo interrupt, so it must not allocate
+        """
+        index = self._sample_index
+        self._samples[index] = pulse_time
+        index += 1
+        if index >= len(self._samples):
+            index = 0
+        self._sample_index = index
+        self._last_sample_time = now
+
     def _delay_us(self, delay:int):
         """
         Custom implementation of time.sleep_us(), used to get around the bug in MicroPython where time.sleep_us() 
@@ -0,0 +1,100 @@
+from .rangefinder import Rangefinder
+from machine import Timer
+
+class RangefinderManager:
+
+    def __init__(self, rangefinders: list, groups: list = None, slot_ms: int = 40, filter_size: int = 5):
+        """
+        Runs several rangefinders in the background, firing them on a schedule so that one sensor's ping
+        isn't heard as another sensor's echo. By default the sensors fire one at a time in turn. Sensors that
+        can't hear each other, such as ones facing opposite ways, can be put in the same group to fire together.
+
+        Every sensor's latest reading is available at any time, without waiting.
+
+        :param rangefinders: The rangefinders to run
+        :type rangefinders: list<Rangefinder>
+        :param groups: Lists of indices into rangefinders that fire together, in firing order. Defaults to each sensor on its own
+        :type groups: list<list<int>>
+        :param slot_ms: Time between firing one group and the next, in milliseconds. Must be long enough for echoes to die down
+        :type slot_ms: int
+        :param filter_size: The number of recent measurements each rangefinder filters over
+        :type filter_size: int
+        """
+        self.rangefinders = rangefinders
+        if groups is None:
+            groups = [[i] for i in range(len(rangefinders))]
+        # Store each group as the rangefinders themselves, so each slot doesn't have to look them up
+        self._groups = [[rangefinders[i] for i in group] for group in groups]
+        self.slot_ms = slot_ms
+        self.filter_size = filter_size
+        self._slot = 0
+        self._timer = Timer(-1)
+        self.running = False
+
+    def start(self):
+        """
+        Starts firing the rangefinders in the background
+        """
+        for rangefinder in self.rangefinders:
+            rangefinder.start_ranging(filter_size=self.filter_size, external_trigger=True)
+        self._slot = 0
+        self._timer.init(period=self.slot_ms, callback=lambda t:self._fire_next_group())
+        self.running = True
+
+    def stop(self):
+        """
+        Stops firing the rangefinders; they go back to pinging only when asked for a distance
+        """
+        self._timer.deinit()
+        for rangefinder in self.rangefinders:
+            rangefinder.stop_ranging()
+        self.running = False
+
+    def _fire_next_group(self):
+        """
+        Non-api method; pings every rangefinder in the next group. Called by the timer
+        """
+        for rangefinder in self._groups[self._slot]:
+            rangefinder._ping()
+        self._slot += 1
+        if self._slot >= len(self._groups):
+            self._slot = 0
+
+    def get_distance(self, index: int) -> float:
+        """
+        :param index: The rangefinder to read
+        :type index: int
+        :return: The latest distance measured by one rangefinder, in cm
+        :rtype: float
+        """
+        return self.rangefinders[index].distance()
+
+    def get_distances(self, distances: list = None) -> list:
+        """
+        Gets the latest distance measured by every rangefinder, in cm. Returns immediately.
+
+        :param distances: An optional list to fill in, one entry per rangefinder, to avoid creating a new list
+        :type distances: list<float>
+        :return: The distances, in the same order as the rangefinders
+        :rtype: list<float>
+        """
+        if distances is None:
+            distances = [0] * len(self.rangefinders)
+        for i in range(len(self.rangefinders)):
+            distances[i] = self.rangefinders[i].distance()
+        return distances
+
+    def get_filtered_distances(self, distances: list = None) -> list:
+        """
+        Gets the filtered distance from every rangefinder, in cm. See Rangefinder.get_filtered_distance()
+
+        :param distances: An optional list to fill in, one entry per rangefinder, to avoid creating a new list
+        :type distances: list<float>
+        :return: The filtered distances, in the same order as the rangefinders
+        :rtype: list<float>
+        """
+        if distances is None:
+            distances = [0] * len(self.rangefinders)
+        for i in range(len(self.rangefinders)):
+            distances[i] = self.rangefinders[i].get_filtered_distance()
+        return distances
@@ -0,0 +1,76 @@
+import time
+
+class RateLimiter:
+    def __init__(self, frequency: float = 100):
+        """
+        Keeps a loop running at a fixed rate by sleeping until the next absolute deadline,
+        rather than for a fixed time after the work is done. Time spent in the loop body therefore
+        doesn't stretch the loop period, so gains tuned at one rate stay valid under load.
+
+        Call sleep() once at the end of every loop iteration.
+
+        :param frequency: The rate to run the loop at, in Hz. Defaults to 100 Hz (10 ms)
+        :type frequency: float
+        """
+        self.period_us = int(1000000 / frequency)
+        self.reset()
+
+    def reset(self):
+        """
+        Restarts the deadlines from the current time and clears the loop statistics
+        """
+        now = time.ticks_us()
+        self.start_time = now
+        self.prev_time = now
+        self.next_deadline = time.ticks_add(now, self.period_us)
+        self.loop_count = 0
+        self.max_period_us = 0
+        self.overrun_count = 0
+
+    def sleep(self):
+        """
+        Sleeps until the next deadline. If the loop body ran past the deadline, this returns
+        immediately, counts an overrun, and starts the following period from now instead of trying to catch up.
+        """
+        remaining = time.ticks_diff(self.next_deadline, time.ticks_us())
+        if remaining < 0:
+            self.overrun_count += 1
+            self.next_deadline = time.ticks_us()
+        else:
+            if remaining >= 1000:
+                time.sleep_ms(remaining // 1000)
+            # Spin for the sub-millisecond remainder
+            while time.ticks_diff(self.next_deadline, time.ticks_us()) > 0:
+                pass
+        self.next_deadline = time.ticks_add(self.next_deadline, self.period_us)
+
+        now = time.ticks_us()
+        period = time.ticks_diff(now, self.prev_time)
+        if period > self.max_period_us:
+            self.max_period_us = period
+        self.prev_time = now
+        self.loop_count += 1
+
+    def get_frequency(self) -> float:
+        """
+        :return: The average rate the loop has actually run at since the last reset, in Hz
+        :rtype: float
+        """
+        elapsed = time.ticks_diff(self.prev_time, self.start_time)
+        if elapsed <= 0:
+            return 0
+        return self.loop_count * 1000000 / elapsed
+
+    def get_max_period(self) -> float:
+        """
+        :return: The longest single loop period seen since the last reset, in seconds
+        :rtype: float
+        """
+        return self.max_period_us / 1000000
+
+    def get_overrun_count(self) -> int:
+        """
+        :return: The number of loops since the last reset whose body ran past its deadline
+        :rtype: int
+        """
+        return self.overrun_count
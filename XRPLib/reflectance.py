@@ -1,4 +1,6 @@
 from machine import Pin, ADC
+import time
+from .adc_sampler import ADCSampler
 
 class Reflectance:
 
@@ -10,10 +12,10 @@ class Reflectance:
         Get the default XRP reflectance sensor instance. This is a singleton, so only one instance of the reflectance sensor will ever exist.
         """
         if cls._DEFAULT_REFLECTANCE_INSTANCE is None:
-            cls._DEFAULT_REFLECTANCE_INSTANCE = cls()
+            cls._DEFAULT_REFLECTANCE_INSTANCE = cls(sampler=ADCSampler.get_default_adc_sampler())
         return cls._DEFAULT_REFLECTANCE_INSTANCE
 
-    def __init__(self, leftPin: int|str = "LINE_L", rightPin: int|str = "LINE_R"):
+    def __init__(self, leftPin: int|str = "LINE_L", rightPin: int|str = "LINE_R", sampler: ADCSampler = None):
         """
         Implements for a reflectance sensor using the built in 12-bit ADC.
         Reads from analog in and converts to a float from 0 (white) to 1 (black)
@@ -22,15 +24,137 @@ class Reflectance:
         :type leftPin: int
         :param rightPin: The pin the right reflectance sensor is connected to
         :type rightPin: int
+        :param sampler: An optional ADCSampler that samples both pins in the background. Reads are then smoothed and never wait on the ADC
+        :type sampler: ADCSampler
         """
-        self._leftReflectance = ADC(Pin(leftPin))
-        self._rightReflectance = ADC(Pin(rightPin))
+        self.sampler = sampler
+        if sampler is None:
+            self._leftReflectance = ADC(Pin(leftPin))
+            self._rightReflectance = ADC(Pin(rightPin))
+        else:
+            self._leftReflectance = sampler.get_channel(leftPin)
+            self._rightReflectance = sampler.get_channel(rightPin)
 
         self.MAX_ADC_VALUE: int = 65536
 
-    def _get_value(self, sensor: ADC) -> float:
+        # Each read is normalized as (raw - offset) * scale, worked out ahead of time so reads stay cheap.
+        # Uncalibrated, this is just the raw reading over the ADC range
+        self._left_offset = 0
+        self._left_scale = 1 / self.MAX_ADC_VALUE
+        self._right_offset = 0
+        self._right_scale = 1 / self.MAX_ADC_VALUE
+        self.calibrated = False
+        self.reset_calibration()
 
-        return sensor.read_u16() / self.MAX_ADC_VALUE
+    def _get_value(self, sensor, offset: int, scale: float) -> float:
+
+        value = (sensor.read_u16() - offset) * scale
+        if value < 0:
+            return 0.0
+        if value > 1:
+            return 1.0
+        return value
+
+    def reset_calibration(self):
+        """
+        Forgets the minimum and maximum readings recorded so far, ready for a new calibration.
+        Reads stay normalized by the current calibration until finish_calibration() or set_calibration() is called
+        """
+        self._left_min = self.MAX_ADC_VALUE
+        self._left_max = 0
+        self._right_min = self.MAX_ADC_VALUE
+        self._right_max = 0
+
+    def update_calibration(self):
+        """
+        Takes a raw reading of both sensors and records it if it is a new minimum or maximum.
+        Call this repeatedly while the sensors pass over both the line and the background
+        """
+        left = self._leftReflectance.read_u16()
+        right = self._rightReflectance.read_u16()
+        if left < self._left_min:
+            self._left_min = left
+        if left > self._left_max:
+            self._left_max = left
+        if right < self._right_min:
+            self._right_min = right
+        if right > self._right_max:
+            self._right_max = right
+
+    def finish_calibration(self) -> bool:
+        """
+        Uses the minimum and maximum readings recorded since reset_calibration() to normalize future reads
+
+        :return: True if the calibration was applied, False if the sensors didn't see enough contrast, in which case the old calibration is kept
+        :rtype: bool
+        """
+        # Anything less than this much contrast is noise rather than a line
+        min_contrast = self.MAX_ADC_VALUE // 20
+        if self._left_max - self._left_min < min_contrast or self._right_max - self._right_min < min_contrast:
+            return False
+        self.set_calibration(self._left_min, self._left_max, self._right_min, self._right_max)
+        return True
+
+    def set_calibration(self, left_min: int, left_max: int, right_min: int, right_max: int):
+        """
+        Sets the raw readings that each sensor gives over the background (white) and the line (black),
+        so that reads are normalized from 0 at the background to 1 at the line. Useful to reuse an earlier calibration
+
+        :param left_min: The raw reading of the left sensor over the background, from 0 to 65535
+        :type left_min: int
+        :param left_max: The raw reading of the left sensor over the line, from 0 to 65535
+        :type left_max: int
+        :param right_min: The raw reading of the right sensor over the background, from 0 to 65535
+        :type right_min: int
+        :param right_max: The raw reading of the right sensor over the line, from 0 to 65535
+        :type right_max: int
+        """
+        self._left_offset = left_min
+        self._left_scale = 1 / max(1, left_max - left_min)
+        self._right_offset = right_min
+        self._right_scale = 1 / max(1, right_max - right_min)
+        self.calibrated = True
+
+    def get_calibration(self) -> tuple:
+        """
+        :return: The raw readings the sensors are normalized between, as (left_min, left_max, right_min, right_max)
+        :rtype: tuple<int>
+        """
+        return (self._left_offset, self._left_offset + round(1 / self._left_scale),
+                self._right_offset, self._right_offset + round(1 / self._right_scale))
+
+    def calibrate(self, drivetrain = None, duration: float = 2.0, effort: float = 0.4) -> bool:
+        """
+        Records the range of both sensors and uses it to normalize future reads.
+        If a drivetrain is given, the robot sweeps left and right in place so that both sensors cross the line,
+        finishing roughly where it started. Otherwise, move the robot over the line by hand during the calibration
+
+        :param drivetrain: The drivetrain to sweep with, or None to move the robot by hand
+        :type drivetrain: DifferentialDrive
+        :param duration: How long to calibrate for, in seconds
+        :type duration: float
+        :param effort: The effort to turn with while sweeping
+        :type effort: float
+        :return: True if the calibration was applied, False if the sensors didn't see enough contrast
+        :rtype: bool
+        """
+        self.reset_calibration()
+        duration_ms = int(duration * 1000)
+        start_time = time.ticks_ms()
+        elapsed = 0
+        while elapsed < duration_ms:
+            if drivetrain is not None:
+                # Turn left for the first quarter, right for the middle half and left again to come back to the start
+                if duration_ms // 4 <= elapsed < duration_ms * 3 // 4:
+                    drivetrain.set_effort(effort, -effort)
+                else:
+                    drivetrain.set_effort(-effort, effort)
+            self.update_calibration()
+            time.sleep(0.01)
+            elapsed = time.ticks_diff(time.ticks_ms(), start_time)
+        if drivetrain is not None:
+            drivetrain.stop()
+        return self.finish_calibration()
 
     def get_left(self) -> float:
         """
@@ -38,7 +162,7 @@ class Reflectance:
         : return: The reflectance ranging from 0 (white) to 1 (black)
         : rtype: float
         """
-        return self._get_value(self._leftReflectance)
+        return self._get_value(self._leftReflectance, self._left_offset, self._left_scale)
 
     def get_right(self) -> float:
         """
@@ -46,4 +170,4 @@ class Reflectance:
         : return: The reflectance ranging from 0 (white) to 1 (black)
         : rtype: float
         """
-        return self._get_value(self._rightReflectance)
+        return self._get_value(self._rightReflectance, self._right_offset, self._right_scale)
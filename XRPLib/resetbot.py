@@ -11,6 +11,8 @@ def reset_motors():
         motor = EncodedMotor.get_default_encoded_motor(i+1)
         motor.set_speed(0)
         motor.reset_encoder_position()
+    # Also stops any motor groups, which would otherwise keep driving their motors
+    EncodedMotor.stop_all()
 
 def reset_led():
     from XRPLib.board import Board
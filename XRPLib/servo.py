@@ -1,4 +1,4 @@
-from machine import Pin, PWM
+from machine import Pin, PWM, Timer
 import sys
 
 class Servo:
@@ -8,6 +8,47 @@ class Servo:
     _DEFAULT_SERVO_THREE_INSTANCE = None
     _DEFAULT_SERVO_FOUR_INSTANCE = None
 
+    # Motion profiles for all servos run from one shared timer, once per servo pulse (50 Hz)
+    _UPDATE_PERIOD_MS = 20
+    _update_timer = None
+    _servo_list = []
+
+    @classmethod
+    def _update_all(cls):
+        """
+        Non-api method; advances the motion profile of every moving servo by one tick
+        """
+        for servo in cls._servo_list:
+            if servo.moving:
+                servo._update()
+
+    @classmethod
+    def move_together(cls, servos: list, angles: list, max_velocity: float = 180, max_acceleration: float = 720):
+        """
+        Moves several servos at once so that they all arrive at the same time. The servo with the furthest to go moves
+        at the given limits, and the others are slowed to match, so their motion has the same shape.
+        Returns straight away; use is_done() to check when they've arrived.
+
+        :param servos: The servos to move
+        :type servos: list<Servo>
+        :param angles: The angle to move each servo to, in the same order
+        :type angles: list<float>
+        :param max_velocity: The fastest the furthest servo may move, in degrees per second
+        :type max_velocity: float
+        :param max_acceleration: The fastest the furthest servo may speed up or slow down, in degrees per second squared
+        :type max_acceleration: float
+        """
+        furthest = 0
+        for servo, angle in zip(servos, angles):
+            if servo.angle is not None:
+                furthest = max(furthest, abs(angle - servo.angle))
+        for servo, angle in zip(servos, angles):
+            if servo.angle is None or furthest == 0 or angle == servo.angle:
+                servo.set_angle(angle)
+                continue
+            scale = abs(angle - servo.angle) / furthest
+            servo.move_to(angle, max_velocity * scale, max_acceleration * scale)
+
     @classmethod
     def get_default_servo(cls, index:int):
         """
@@ -51,16 +92,108 @@ class Servo:
         self.MICROSEC_PER_DEGREE: int = 10000
         self.LOW_ANGLE_OFFSET: int = 500000
 
+        # Motion profile state. The angle is unknown until the servo is first set
+        self.angle = None
+        self.target_angle = None
+        self.velocity = 0
+        self.max_velocity = 180
+        self.max_acceleration = 720
+        self.moving = False
+        Servo._servo_list.append(self)
+
     def set_angle(self, degrees: float):
         """
         Sets the angle of the servo
         :param degrees: The angle to set the servo to [0,200]
         :ptype degrees: float
         """
-        self._servo.duty_ns(int(degrees * self.MICROSEC_PER_DEGREE + self.LOW_ANGLE_OFFSET))
+        # Jumping straight to an angle cancels any motion in progress
+        self.moving = False
+        self.velocity = 0
+        self.angle = degrees
+        self.target_angle = degrees
+        self._write_angle(degrees)
+
+    def move_to(self, degrees: float, max_velocity: float = None, max_acceleration: float = None):
+        """
+        Moves the servo smoothly to an angle in the background, speeding up and slowing down within the given limits
+        instead of jumping there. Returns straight away; use is_done() to check when it has arrived.
+        If the servo's angle isn't known yet, because it hasn't been set since startup, it jumps to the angle instead.
+
+        :param degrees: The angle to move the servo to [0,200]
+        :type degrees: float
+        :param max_velocity: The fastest the servo may move, in degrees per second. Defaults to the last value used, initially 180
+        :type max_velocity: float
+        :param max_acceleration: The fastest the servo may speed up or slow down, in degrees per second squared. Defaults to the last value used, initially 720
+        :type max_acceleration: float
+        """
+        if max_velocity is not None:
+            self.max_velocity = max_velocity
+        if max_acceleration is not None:
+            self.max_acceleration = max_acceleration
+        if self.angle is None:
+            self.set_angle(degrees)
+            return
+        self.target_angle = degrees
+        if Servo._update_timer is None:
+            # Use a virtual timer so we can leave the hardware timers up for the user
+            Servo._update_timer = Timer(-1)
+            Servo._update_timer.init(period=Servo._UPDATE_PERIOD_MS, callback=lambda t:Servo._update_all())
+        # Set last, so the timer never sees a half set up move
+        self.moving = True
+
+    def is_done(self) -> bool:
+        """
+        :return: If the servo has finished its last move_to()
+        :rtype: bool
+        """
+        return not self.moving
+
+    def get_angle(self) -> float:
+        """
+        :return: The angle the servo has been sent to, which follows the motion profile while it moves. None if it hasn't been set yet
+        :rtype: float
+        """
+        return self.angle
 
     def free(self):
         """
         Allows the servo to spin freely without holding position
         """
+        self.moving = False
+        self.velocity = 0
         self._servo.duty_ns(0)
+
+    def _write_angle(self, degrees: float):
+        """
+        Non-api method; sends the pulse for an angle to the servo
+        """
+        self._servo.duty_ns(int(degrees * self.MICROSEC_PER_DEGREE + self.LOW_ANGLE_OFFSET))
+
+    def _update(self):
+        """
+        Non-api method; advances the motion profile by one tick. Called by the shared servo timer
+        """
+        timestep = Servo._UPDATE_PERIOD_MS / 1000
+        distance = self.target_angle - self.angle
+        direction = 1 if distance >= 0 else -1
+        distance *= direction
+        # Speed towards the target; negative if still moving away from it after the target changed
+        speed = self.velocity * direction
+        speed_step = self.max_acceleration * timestep
+
+        if speed > 0 and speed * speed / (2 * self.max_acceleration) >= distance:
+            # Close enough that it's time to slow down, but don't stall short of the target
+            speed = max(speed_step, speed - speed_step)
+        else:
+            speed = min(self.max_velocity, speed + speed_step)
+
+        step = speed * timestep
+        if step >= distance:
+            self.angle = self.target_angle
+            self.velocity = 0
+            self.moving = False
+        else:
+            self.angle += direction * step
+            self.velocity = direction * speed
+        self._write_angle(self.angle)
@@ -0,0 +1,123 @@
+from .encoded_motor import EncodedMotor
+from .imu import IMU
+import time
+import math
+
+class SlipDetector:
+    def __init__(self, left_motor: EncodedMotor, right_motor: EncodedMotor, imu: IMU, wheel_diam: float = 6.0, wheel_track: float = 15.5,
+                 max_yaw_rate_error: float = 30, max_acceleration_error: float = 150, forward_axis: int = 1, detection_count: int = 3, callback = None):
+        """
+        Detects wheel slip by cross-checking what the encoders say the robot is doing against what the IMU measures.
+        The yaw rate from the encoder difference is compared against the gyro, and the forward acceleration from the
+        encoders is compared against the accelerometer. Call update() once per control loop.
+        The IMU is switched to reading the accelerometer in the background, so updates don't wait on I2C.
+
+        :param left_motor: The left motor of the drivetrain
+        :type left_motor: EncodedMotor
+        :param right_motor: The right motor of the drivetrain
+        :type right_motor: EncodedMotor
+        :param imu: The IMU of the robot
+        :type imu: IMU
+        :param wheel_diam: The diameter of the wheels in cm
+        :type wheel_diam: float
+        :param wheel_track: The distance between the wheels in cm
+        :type wheel_track: float
+        :param max_yaw_rate_error: The largest allowed difference between encoder and gyro yaw rate, in degrees per second
+        :type max_yaw_rate_error: float
+        :param max_acceleration_error: The largest allowed amount the wheels may accelerate faster than the robot body, in cm/s^2
+        :type max_acceleration_error: float
+        :param forward_axis: The accelerometer axis that points forwards on the robot. 0 for X, 1 for Y, 2 for Z. On the XRP, X points sideways (the IMU's pitch axis) and Y forwards
+        :type forward_axis: int
+        :param detection_count: The number of consecutive updates that must disagree before slip is reported
+        :type detection_count: int
+        :param callback: An optional function called with True when slip starts and False when it ends
+        :type callback: function
+        """
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.imu = imu
+        self.track_width = wheel_track
+        self.max_yaw_rate_error = max_yaw_rate_error
+        self.max_acceleration_error = max_acceleration_error
+        self.forward_axis = forward_axis
+        self.detection_count = detection_count
+        self.callback = callback
+        imu.set_background_acc(True)
+
+        # Converts motor rpm to wheel surface speed in cm/s
+        self._rpm_to_cmps = math.pi * wheel_diam / 60
+        # Converts mg to cm/s^2
+        self._mg_to_cmps2 = 0.980665
+
+        # Low pass filter constant for the acceleration estimates, which come from differentiated and noisy data
+        self.acceleration_filter = 0.3
+
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the slip flag and all previous data
+        """
+        self.slipping = False
+        self.times = 0
+        self.prev_time = None
+        self.prev_speed = 0
+        self.encoder_acceleration = 0
+        self.imu_acceleration = 0
+        self.yaw_rate_error = 0
+
+    def update(self) -> bool:
+        """
+        Takes a new set of encoder and IMU readings and checks them against each other
+
+        :return: If the wheels are currently slipping
+        :rtype: bool
+        """
+        current_time = time.ticks_us()
+        left_speed = self.left_motor.get_speed() * self._rpm_to_cmps
+        right_speed = self.right_motor.get_speed() * self._rpm_to_cmps
+        speed = (left_speed + right_speed) / 2
+
+        gyro_yaw_rate = self.imu.get_yaw_rate()
+        encoder_yaw_rate = math.degrees((right_speed - left_speed) / self.track_width)
+        self.yaw_rate_error = encoder_yaw_rate - gyro_yaw_rate
+
+        if self.prev_time is None:
+            self.prev_time = current_time
+            self.prev_speed = speed
+            return self.slipping
+
+        timestep = time.ticks_diff(current_time, self.prev_time) / 1000000
+        self.prev_time = current_time
+        if timestep <= 0:
+            return self.slipping
+
+        encoder_acceleration = (speed - self.prev_speed) / timestep
+        self.prev_speed = speed
+        imu_acceleration = self.imu.get_last_acc_rates()[self.forward_axis] * self._mg_to_cmps2
+
+        self.encoder_acceleration += self.acceleration_filter * (encoder_acceleration - self.encoder_acceleration)
+        self.imu_acceleration += self.acceleration_filter * (imu_acceleration - self.imu_acceleration)
+
+        # Wheels spinning up or locking up change speed faster than the body does, whichever way the accelerometer is mounted
+        acceleration_error = abs(self.encoder_acceleration) - abs(self.imu_acceleration)
+
+        if abs(self.yaw_rate_error) > self.max_yaw_rate_error or acceleration_error > self.max_acceleration_error:
+            self.times += 1
+        else:
+            self.times = 0
+
+        slipping = self.times >= self.detection_count
+        if slipping != self.slipping:
+            self.slipping = slipping
+            if self.callback is not None:
+                self.callback(slipping)
+
+        return self.slipping
+
+    def is_slipping(self) -> bool:
+        """
+        :return: If slip was detected on the most recent update
+        :rtype: bool
+        """
+        return self.slipping
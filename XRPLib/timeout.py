@@ -5,6 +5,15 @@ class Timeout:
         """
         Starts a timer that will expire after the given timeout.
 
+        :param timeout: The timeout, in seconds
+        :type timeout: float
+        """
+        self.reset(timeout)
+
+    def reset(self, timeout: float):
+        """
+        Restarts the timer with a new timeout, so that the same Timeout can be reused.
+
         :param timeout: The timeout, in seconds
         :type timeout: float
         """
@@ -0,0 +1,63 @@
+import os
+import sys
+import types
+import unittest
+
+# XRPLib/__init__.py only imports on MicroPython, so load the controller modules straight from the package directory
+_package = types.ModuleType("XRPLib")
+_package.__path__ = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "XRPLib")]
+sys.modules.setdefault("XRPLib", _package)
+
+from XRPLib.pid import PID, AdvancedPID, GainScheduledPID
+
+
+class AdvancedPIDTest(unittest.TestCase):
+
+    def test_max_output_below_min_output_still_drives(self):
+        # straight() sets max_output to the requested effort, which may be below min_output
+        pid = AdvancedPID(kp=0.1, ki=0.04, kd=0.04, min_output=0.3, max_integral=10, tolerance=0.25, timestep=0.01)
+        pid.max_output = 0.25
+        for _ in range(5):
+            self.assertAlmostEqual(pid.update(20), 0.25, places=6)
+        pid.clear_history()
+        self.assertAlmostEqual(pid.update(-20), -0.25, places=6)
+
+    def test_max_output_equal_to_min_output_drives(self):
+        pid = AdvancedPID(kp=0.1, min_output=0.3, max_output=0.3, timestep=0.01)
+        self.assertAlmostEqual(pid.update(5), 0.3, places=6)
+
+    def test_no_offset_inside_deadband(self):
+        pid = AdvancedPID(kp=0.1, min_output=0.3, tolerance=0.25, timestep=0.01)
+        self.assertAlmostEqual(pid.update(0.1), 0.1 * 0.1, places=6)
+
+    def test_offset_added_outside_deadband(self):
+        pid = AdvancedPID(kp=0.1, min_output=0.3, tolerance=0.25, timestep=0.01)
+        self.assertAlmostEqual(pid.update(2), 0.3 + 0.2, places=6)
+
+    def test_floor_mode_matches_pid(self):
+        advanced = AdvancedPID(kp=0.2, min_output=0.1, tolerance=1, timestep=0.01, derivative_filter=0, offset_min_output=False)
+        plain = PID(kp=0.2, min_output=0.1, tolerance=1, timestep=0.01)
+        for error in (30, 3, 0.2, -0.2, -3, -30):
+            self.assertAlmostEqual(advanced.update(error), plain.update(error), places=6)
+
+
+class GainScheduledPIDTest(unittest.TestCase):
+
+    def test_turn_below_min_output_still_drives(self):
+        # turn(90, 0.08) with the default turn controller used to output nothing and time out
+        pid = GainScheduledPID([(0.5, 0.2, 0.004, 0.0036), (1.0, 0.2, 0.004, 0.007)],
+                               min_output=0.1, max_integral=30, tolerance=1, timestep=0.01, offset_min_output=False)
+        pid.set_operating_point(0.08)
+        pid.max_output = 0.08
+        for _ in range(5):
+            self.assertAlmostEqual(pid.update(90), 0.08, places=6)
+
+    def test_offset_mode_below_min_output_still_drives(self):
+        pid = GainScheduledPID([(0.5, 0.2, 0.004, 0.0036), (1.0, 0.2, 0.004, 0.007)],
+                               min_output=0.1, tolerance=1, timestep=0.01)
+        pid.max_output = 0.08
+        self.assertAlmostEqual(pid.update(-90), -0.08, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()